@@ -8,7 +8,13 @@ import json
 import os
 import re
 import shutil
-import glob
+import time
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify, send_from_directory, send_file
 from flask_cors import CORS
 from image_generator import ImageGenerator
@@ -19,9 +25,27 @@ from audio_generator import AudioGenerator
 from video_post_processor import VideoPostProcessor
 from config_manager import config
 
+# [PERF] orjson 为可选依赖: 故事 JSON 较大时解析/序列化明显更快，缺失时回退到标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 app = Flask(__name__, static_folder='static')
 CORS(app)
 
+# [PERF] 图片/视频等大文件: 部署在支持 X-Sendfile 的前端服务器之后时，由其直接发送文件
+# 未开启时 send_file 会使用 WSGI 服务器提供的 wsgi.file_wrapper (sendfile) 发送
+app.config["USE_X_SENDFILE"] = bool(config.get("server", "use_x_sendfile"))
+
+# 优化 API 复用的 HTTP 会话 (keep-alive，避免每次请求重新 TCP/TLS 握手)
+_opt_session = requests.Session()
+_opt_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16,
+                           max_retries=Retry(total=2, backoff_factor=0.2))
+_opt_session.mount("https://", _opt_adapter)
+_opt_session.mount("http://", _opt_adapter)
+_opt_session.headers.update({"Content-Type": "application/json"})
+
 # 初始化生成器 V1（使用配置）
 image_gen = ImageGenerator(
     api_key=config.get("image_api", "api_key"),
@@ -67,16 +91,52 @@ audio_gen = AudioGenerator(
     default_ref_audio=config.get("audio_api", "reference_audio_cn")
 )
 
+# 基础目录 (启动时计算一次)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+
 # 全局状态
 story_data = None
+page_index_map: dict[int, dict] = {}  # {page_index: page}，随 story_data 在 init_project_from_story 中重建
 current_project_dir = None  # 当前项目输出目录
 current_project_name = None  # 当前项目名称（清理后的 title）
+current_images_dir = None  # 当前项目子目录 (在 init_project_from_story 中计算)
+current_videos_dir = None
+current_audio_dir = None
+current_char_sheet_path = None  # 当前项目设计稿/分镜图片路径 (在 init_project_from_story 中计算)
+current_scene_sheet_path = None
+current_page_image_paths: dict[int, str] = {}
 current_style = None  # 当前选中的风格名称
 
 # 风格图片目录
-STYLES_DIR = os.path.join(os.path.dirname(__file__), "styles")
+STYLES_DIR = os.path.join(BASE_DIR, "styles")
 os.makedirs(STYLES_DIR, exist_ok=True)
 
+# 风格索引 {风格名称: 文件名}，避免每次请求都扫描 STYLES_DIR
+_styles_index: dict[str, str] = {}
+
+
+def _rebuild_styles_index():
+    """扫描 STYLES_DIR 重建风格索引"""
+    global _styles_index
+    index = {}
+    with os.scandir(STYLES_DIR) as it:
+        for entry in it:
+            if entry.is_file():
+                index[os.path.splitext(entry.name)[0]] = entry.name
+    _styles_index = index
+
+
+def _get_style_path(name: str):
+    """根据风格名称返回风格图片路径，不存在时返回 None"""
+    filename = _styles_index.get(name)
+    if filename is None:
+        return None
+    return os.path.join(STYLES_DIR, filename)
+
+
+_rebuild_styles_index()
+
 generation_status = {
     "character_sheet": None,
     "scene_sheet": None,
@@ -86,13 +146,71 @@ generation_status = {
     "srt": None   # None, "generating", "completed", "failed"
 }
 
-# 全局任务计数 (Debug)
+# 全局任务计数 (Debug)，经 _track_task 原子增减
 active_video_tasks = 0
 active_audio_tasks = 0
 
+# 保护任务计数与 generation_status["pages"] 的写入；临界区只做字典替换，持锁时间极短
+_state_lock = threading.Lock()
+
+
+def _track_task(kind: str, delta: int) -> int:
+    """原子地增减进行中的视频/音频任务数，返回新值"""
+    global active_video_tasks, active_audio_tasks
+    with _state_lock:
+        if kind == "video":
+            active_video_tasks += delta
+            return active_video_tasks
+        active_audio_tasks += delta
+        return active_audio_tasks
+
+
+def _new_page_status() -> dict:
+    return {"image": None, "video": None, "audio": {"cn": None, "en": None}, "selected": False}
+
+
+def _set_page_status(page_index: int, key: str, value, lang: str = None):
+    """
+    写入单页状态 (写时复制)
+    不原地修改已发布的页面字典，而是构造新字典整体替换，/api/status 读取时不会看到写了一半的状态
+    """
+    with _state_lock:
+        pages = generation_status["pages"]
+        entry = dict(pages.get(page_index) or _new_page_status())
+        if lang is None:
+            entry[key] = value
+        else:
+            audio = entry.get(key)
+            audio = dict(audio) if isinstance(audio, dict) else {"cn": None, "en": None}
+            audio[lang] = value
+            entry[key] = audio
+        pages[page_index] = entry
+
+# 非法项目名称: 包含 .. 或路径分隔符 (防止路径穿越)
+_BAD_PROJECT_RE = re.compile(r'\.\.|[\\/]')
+
+# 文件名非法字符: 保留字母数字 (\w 与 str.isalnum 一致，另含下划线)、空格、-、全角括号
+_SANITIZE_RE = re.compile(r'[^\w \-（）]')
+
+
 def sanitize_filename(name: str) -> str:
     """清理文件名中的非法字符"""
-    return "".join(c for c in name if c.isalnum() or c in (' ', '_', '-', '（', '）')).strip()
+    return _SANITIZE_RE.sub('', name).strip()
+
+
+# JSON 修复用正则 (模块级预编译，避免每次请求重复解析)
+_TRIPLE_QUOTES_RE = re.compile(r'"""(.*?)"""', re.DOTALL)  # 匹配 """...""" 模式（非贪婪）
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')  # 对象/数组末尾的逗号，一次扫描处理
+
+
+def _replace_triple_quotes(match):
+    """将三引号多行字符串转换为标准双引号字符串"""
+    inner = match.group(1)
+    # 将实际换行符替换为 \\n 转义序列
+    inner = inner.replace('\r\n', '\\n').replace('\n', '\\n')
+    # 将内部的双引号转义
+    inner = inner.replace('"', '\\"')
+    return '"' + inner + '"'
 
 
 def fix_json_content(content: str) -> str:
@@ -101,28 +219,63 @@ def fix_json_content(content: str) -> str:
     - 三引号多行字符串 -> 标准双引号
     - 尾随逗号
     """
-    import re
-    
     # 修复三引号多行字符串
-    def replace_triple_quotes(match):
-        inner = match.group(1)
-        # 将实际换行符替换为 \\n 转义序列
-        inner = inner.replace('\r\n', '\\n').replace('\n', '\\n')
-        # 将内部的双引号转义
-        inner = inner.replace('"', '\\"')
-        return '"' + inner + '"'
-    
-    # 匹配 """...""" 模式（非贪婪）
-    pattern = r'"""(.*?)"""'
-    content = re.sub(pattern, replace_triple_quotes, content, flags=re.DOTALL)
+    content = _TRIPLE_QUOTES_RE.sub(_replace_triple_quotes, content)
     
     # 移除尾随逗号（对象和数组末尾的逗号）
-    content = re.sub(r',\s*}', '}', content)
-    content = re.sub(r',\s*]', ']', content)
+    content = _TRAILING_COMMA_RE.sub(r'\1', content)
     
     return content
 
 
+def json_loads(content):
+    """解析 JSON (str 或 bytes)，优先使用 orjson"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def json_dumps_bytes(data, indent: bool = False) -> bytes:
+    """序列化为 UTF-8 JSON 字节 (不转义中文)，优先使用 orjson"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, option=option)
+    return json.dumps(data, ensure_ascii=False, indent=2 if indent else None).encode("utf-8")
+
+
+def fast_jsonify(payload: dict):
+    """高频接口使用的 jsonify 替代 (绕过 Flask 默认编码器)"""
+    if orjson is None:
+        return jsonify(payload)
+    return app.response_class(json_dumps_bytes(payload), mimetype="application/json")
+
+
+# 目录文件名缓存: {目录路径: (st_mtime_ns, frozenset(文件名))}
+_dir_files_cache = {}
+
+
+def _dir_files(path: str) -> frozenset:
+    """
+    返回目录下的文件名集合，用一次 os.scandir 代替逐个 os.path.exists
+    目录 mtime 未变化时直接复用缓存；mtime 在 1 秒内的目录不缓存，避免同一时间片内新建的文件被漏掉
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return frozenset()
+    
+    cached = _dir_files_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    
+    with os.scandir(path) as it:
+        names = frozenset(entry.name for entry in it)
+    
+    if time.time_ns() - mtime > 1_000_000_000:
+        _dir_files_cache[path] = (mtime, names)
+    return names
+
+
 def reset_generation_status():
     """重置生成状态"""
     global generation_status
@@ -138,60 +291,75 @@ def reset_generation_status():
 
 def init_project_from_story():
     """根据 story_data 初始化项目目录和状态"""
-    global current_project_dir, current_project_name, generation_status
+    global current_project_dir, current_project_name, generation_status, page_index_map
+    global current_images_dir, current_videos_dir, current_audio_dir
+    global current_char_sheet_path, current_scene_sheet_path, current_page_image_paths
     
     if not story_data:
         return False
     
+    page_index_map = {p["page_index"]: p for p in story_data.get("script", [])}
+    
     # 创建以 title 命名的项目目录
     title = story_data.get("title", "untitled")
     current_project_name = sanitize_filename(title)
     if not current_project_name:
         current_project_name = "untitled"
     
-    current_project_dir = os.path.join(os.path.dirname(__file__), "output", current_project_name)
-    os.makedirs(os.path.join(current_project_dir, "images"), exist_ok=True)
-    os.makedirs(os.path.join(current_project_dir, "videos"), exist_ok=True)
-    os.makedirs(os.path.join(current_project_dir, "audio"), exist_ok=True)
+    current_project_dir = os.path.join(OUTPUT_DIR, current_project_name)
+    current_images_dir = os.path.join(current_project_dir, "images")
+    current_videos_dir = os.path.join(current_project_dir, "videos")
+    current_audio_dir = os.path.join(current_project_dir, "audio")
+    os.makedirs(current_images_dir, exist_ok=True)
+    os.makedirs(current_videos_dir, exist_ok=True)
+    os.makedirs(current_audio_dir, exist_ok=True)
     
     # 更新生成器输出目录 (两个生成器都更新)
     image_gen.output_dir = current_project_dir
     image_gen_v2.output_dir = current_project_dir
     image_gen_flow.output_dir = current_project_dir
-    video_gen.output_dir = os.path.join(current_project_dir, "videos")
-    
-    # 初始化每一页的状态
-    for page in story_data.get("script", []):
-        idx = page["page_index"]
-        if idx not in generation_status["pages"]:
-            generation_status["pages"][idx] = {
-                "image": None,
-                "video": None,
-                "audio": {"cn": None, "en": None},
-                "selected": False
-            }
-        
-        # 检查文件是否存在
-        if generation_status["pages"][idx]["image"] is None:
-            if os.path.exists(f"{current_project_dir}/images/page_{idx:03d}.png"):
-                generation_status["pages"][idx]["image"] = "completed"
-                
-        if generation_status["pages"][idx]["video"] is None:
-            if os.path.exists(f"{current_project_dir}/videos/page_{idx:03d}.mp4"):
-                generation_status["pages"][idx]["video"] = "completed"
-
-        # 检查音频状态 (双语)
-        if generation_status["pages"][idx]["audio"] is None: # fix dirty data if needed
-             generation_status["pages"][idx]["audio"] = {"cn": None, "en": None}
-             
-        if generation_status["pages"][idx]["audio"]["cn"] is None:
-            if os.path.exists(f"{current_project_dir}/audio/page_{idx:03d}_cn.wav") or \
-               os.path.exists(f"{current_project_dir}/audio/page_{idx:03d}.wav"):
-                generation_status["pages"][idx]["audio"]["cn"] = "completed"
-                
-        if generation_status["pages"][idx]["audio"]["en"] is None:
-            if os.path.exists(f"{current_project_dir}/audio/page_{idx:03d}_en.wav"):
-                generation_status["pages"][idx]["audio"]["en"] = "completed"
+    video_gen.output_dir = current_videos_dir
+    
+    # 缓存常用路径 (所有图片生成器共用同一输出目录)
+    current_char_sheet_path = image_gen.get_character_sheet_path()
+    current_scene_sheet_path = image_gen.get_scene_sheet_path()
+    current_page_image_paths = {idx: image_gen.get_page_image_path(idx) for idx in page_index_map}
+    
+    # 每个子目录只扫描一次
+    img_files = _dir_files(current_images_dir)
+    vid_files = _dir_files(current_videos_dir)
+    aud_files = _dir_files(current_audio_dir)
+    
+    # 初始化每一页的状态 (写时复制，见 _set_page_status)
+    with _state_lock:
+        pages = generation_status["pages"]
+        for page in story_data.get("script", []):
+            idx = page["page_index"]
+            entry = dict(pages.get(idx) or _new_page_status())
+            
+            # 检查文件是否存在
+            if entry.get("image") is None:
+                if f"page_{idx:03d}.png" in img_files:
+                    entry["image"] = "completed"
+                    
+            if entry.get("video") is None:
+                if f"page_{idx:03d}.mp4" in vid_files:
+                    entry["video"] = "completed"
+
+            # 检查音频状态 (双语)
+            audio = entry.get("audio")
+            audio = dict(audio) if isinstance(audio, dict) else {"cn": None, "en": None} # fix dirty data if needed
+                 
+            if audio.get("cn") is None:
+                if f"page_{idx:03d}_cn.wav" in aud_files or f"page_{idx:03d}.wav" in aud_files:
+                    audio["cn"] = "completed"
+                    
+            if audio.get("en") is None:
+                if f"page_{idx:03d}_en.wav" in aud_files:
+                    audio["en"] = "completed"
+            
+            entry["audio"] = audio
+            pages[idx] = entry
 
     return True
 
@@ -199,7 +367,7 @@ def init_project_from_story():
 def load_story_data():
     """加载故事数据"""
     global story_data
-    json_path = os.path.join(os.path.dirname(__file__), "child_story_fixed.json")
+    json_path = os.path.join(BASE_DIR, "child_story_fixed.json")
     if os.path.exists(json_path):
         with open(json_path, "r", encoding="utf-8") as f:
             content = f.read()
@@ -207,14 +375,33 @@ def load_story_data():
         # 使用 fix_json_content 预处理
         content = fix_json_content(content)
         
-        story_data = json.loads(content)
+        story_data = json_loads(content)
         init_project_from_story()
         return True
     return False
 
 
-# 启动时加载数据
-load_story_data()
+# 故事数据延迟到首个请求时加载 (不在 import 时读取/解析，加快启动)
+_story_lock = threading.Lock()
+_story_loaded = False
+
+
+def ensure_story_loaded():
+    """首次调用时加载默认故事数据，之后直接返回"""
+    global _story_loaded
+    if _story_loaded:
+        return
+    with _story_lock:
+        if not _story_loaded:
+            if story_data is None:
+                load_story_data()
+            _story_loaded = True
+
+
+@app.before_request
+def _load_story_before_request():
+    """请求处理前确保故事数据已加载 (各生成接口直接读取 story_data；只有首个请求真正读取文件)"""
+    ensure_story_loaded()
 
 
 # ===== 配置相关 API =====
@@ -222,7 +409,7 @@ load_story_data()
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """获取当前配置"""
-    # 强制重载以获取最新状态和错误
+    # 文件有变化时重载，以获取最新状态和错误
     current_config = config.to_dict()
     
     return jsonify({
@@ -238,25 +425,32 @@ def update_config():
     try:
         data = request.get_json()
         
+        # 先写入尚未保存的延迟修改，再强制从磁盘重新读取，以最新配置为准读取旧值
+        config.reload()
+        current = config.config
+        
         # 更新图片 API 配置
         if "image_api" in data:
             img_cfg = data["image_api"]
+            current_img = current.get("image_api", {})
             config.update_image_api(
-                base_url=img_cfg.get("base_url", config.get("image_api", "base_url")),
-                api_key=img_cfg.get("api_key", config.get("image_api", "api_key")),
-                model=img_cfg.get("model", config.get("image_api", "model"))
+                base_url=img_cfg.get("base_url", current_img.get("base_url")),
+                api_key=img_cfg.get("api_key", current_img.get("api_key")),
+                model=img_cfg.get("model", current_img.get("model")),
+                save=False
             )
             # 更新生成器
+            new_img = config.config["image_api"]
             image_gen.update_config(
-                api_key=config.get("image_api", "api_key"),
-                base_url=config.get("image_api", "base_url"),
-                model=config.get("image_api", "model")
+                api_key=new_img["api_key"],
+                base_url=new_img["base_url"],
+                model=new_img["model"]
             )
         
         # [NEW] 更新图片 API V2 配置
         if "image_api_v2" in data:
             v2_cfg = data["image_api_v2"]
-            current_v2 = config.config.get("image_api_v2", {})
+            current_v2 = current.get("image_api_v2", {})
             current_v2.update({
                 "base_url": v2_cfg.get("base_url", current_v2.get("base_url", "")),
                 "api_key": v2_cfg.get("api_key", current_v2.get("api_key", "")),
@@ -264,11 +458,19 @@ def update_config():
                 "image_size": v2_cfg.get("image_size", current_v2.get("image_size", ""))
             })
             config.config["image_api_v2"] = current_v2
+            
+            # 更新 V2 生成器
+            image_gen_v2.update_config(
+                api_key=current_v2.get("api_key", ""),
+                base_url=current_v2.get("base_url", ""),
+                model=current_v2.get("model"),
+                image_size=current_v2.get("image_size")
+            )
 
         # [NEW] 更新 Flow API 配置
         if "flow_api" in data:
             flow_cfg = data["flow_api"]
-            current_flow = config.config.get("flow_api", {})
+            current_flow = current.get("flow_api", {})
             current_flow.update({
                 "base_url": flow_cfg.get("base_url", current_flow.get("base_url", "")),
                 "api_key": flow_cfg.get("api_key", current_flow.get("api_key", "")),
@@ -282,49 +484,47 @@ def update_config():
                 base_url=current_flow.get("base_url"),
                 model=current_flow.get("model")
             )
-            config.save_config()
-            # 更新 V2 生成器
-            image_gen_v2.update_config(
-                api_key=current_v2.get("api_key", ""),
-                base_url=current_v2.get("base_url", ""),
-                model=current_v2.get("model"),
-                image_size=current_v2.get("image_size")
-            )
         
         # 更新视频 API 配置
         if "video_api" in data:
             vid_cfg = data["video_api"]
+            current_vid = current.get("video_api", {})
             config.update_video_api(
-                base_url=vid_cfg.get("base_url", config.get("video_api", "base_url")),
-                api_key=vid_cfg.get("api_key", config.get("video_api", "api_key")),
-                model=vid_cfg.get("model", config.get("video_api", "model"))
+                base_url=vid_cfg.get("base_url", current_vid.get("base_url")),
+                api_key=vid_cfg.get("api_key", current_vid.get("api_key")),
+                model=vid_cfg.get("model", current_vid.get("model")),
+                save=False
             )
             # 更新生成器
+            new_vid = config.config["video_api"]
             video_gen.update_config(
-                api_key=config.get("video_api", "api_key"),
-                base_url=config.get("video_api", "base_url"),
-                model_name=config.get("video_api", "model")
+                api_key=new_vid["api_key"],
+                base_url=new_vid["base_url"],
+                model_name=new_vid["model"]
             )
         
         # [FIX] 更新音频 API 配置
         if "audio_api" in data:
             audio_cfg = data["audio_api"]
+            current_audio = current.get("audio_api", {})
             config.update_audio_api(
-                base_url=audio_cfg.get("base_url", config.get("audio_api", "base_url")),
-                reference_audio_cn=audio_cfg.get("reference_audio_cn", config.get("audio_api", "reference_audio_cn")),
-                reference_audio_en=audio_cfg.get("reference_audio_en", config.get("audio_api", "reference_audio_en"))
+                base_url=audio_cfg.get("base_url", current_audio.get("base_url")),
+                reference_audio_cn=audio_cfg.get("reference_audio_cn", current_audio.get("reference_audio_cn")),
+                reference_audio_en=audio_cfg.get("reference_audio_en", current_audio.get("reference_audio_en")),
+                save=False
             )
             # 更新生成器 (使用中文作为默认)
+            new_audio = config.config["audio_api"]
             audio_gen.update_config(
-                api_url=config.get("audio_api", "base_url"),
-                default_ref_audio=config.get("audio_api", "reference_audio_cn")
+                api_url=new_audio["base_url"],
+                default_ref_audio=new_audio["reference_audio_cn"]
             )
         
         # 更新优化 API 配置
         if "optimize_api" in data:
             opt_cfg = data["optimize_api"]
             # 直接更新整个 optimize_api 部分
-            current_opt = config.config.get("optimize_api", {})
+            current_opt = current.get("optimize_api", {})
             current_opt.update({
                 "base_url": opt_cfg.get("base_url", current_opt.get("base_url", "")),
                 "api_key": opt_cfg.get("api_key", current_opt.get("api_key", "")),
@@ -333,17 +533,16 @@ def update_config():
                 "video_prompt_template": opt_cfg.get("video_prompt_template", current_opt.get("video_prompt_template", ""))
             })
             config.config["optimize_api"] = current_opt
-            config.save_config()
         
         # 更新其他配置
         if "generation" in data:
             for key, value in data["generation"].items():
-                config.set("generation", key, value=value)
+                config.set("generation", key, value=value, save=False)
         
         # [FIX] 更新视频后处理配置
         if "video_post_processing" in data:
             vpp_cfg = data["video_post_processing"]
-            current_vpp = config.config.get("video_post_processing", {})
+            current_vpp = current.get("video_post_processing", {})
             current_vpp.update({
                 "scene_threshold": vpp_cfg.get("scene_threshold", current_vpp.get("scene_threshold", 27.0)),
                 "video_volume": vpp_cfg.get("video_volume", current_vpp.get("video_volume", 0.05)),
@@ -351,12 +550,14 @@ def update_config():
                 "skip_first_scene": vpp_cfg.get("skip_first_scene", current_vpp.get("skip_first_scene", True))
             })
             config.config["video_post_processing"] = current_vpp
-            config.save_config()
+        
+        # 所有修改完成后统一写入一次文件 (延迟写入: 由后台线程合并写盘，请求路径上不做磁盘 I/O)
+        config.save_config(sync=False)
         
         return jsonify({
             "success": True,
             "message": "配置已更新",
-            "config": config.to_dict()
+            "config": config.snapshot()
         })
         
     except Exception as e:
@@ -371,8 +572,10 @@ def update_config():
 @app.route('/api/styles', methods=['GET'])
 def list_styles():
     """获取所有已保存的风格"""
+    # 列表接口顺带刷新索引，以识别手动放入 styles 目录的文件
+    _rebuild_styles_index()
     styles = []
-    for f in os.listdir(STYLES_DIR):
+    for f in _styles_index.values():
         if f.lower().endswith(('.png', '.jpg', '.jpeg', '.webp')):
             name = os.path.splitext(f)[0]
             styles.append({
@@ -407,6 +610,7 @@ def upload_style():
     ext = os.path.splitext(file.filename)[1].lower() or '.png'
     save_path = os.path.join(STYLES_DIR, f"{name}{ext}")
     file.save(save_path)
+    _styles_index[name] = f"{name}{ext}"
     
     # 自动设为当前风格
     current_style = name
@@ -424,14 +628,16 @@ def delete_style(name):
     global current_style
     
     # 查找匹配的文件
-    for f in os.listdir(STYLES_DIR):
-        if os.path.splitext(f)[0] == name:
-            os.remove(os.path.join(STYLES_DIR, f))
-            if current_style == name:
-                current_style = None
-            return jsonify({"success": True, "message": f"风格 '{name}' 已删除"})
+    style_path = _get_style_path(name)
+    if style_path is None:
+        return jsonify({"success": False, "error": f"风格 '{name}' 不存在"})
     
-    return jsonify({"success": False, "error": f"风格 '{name}' 不存在"})
+    if os.path.exists(style_path):
+        os.remove(style_path)
+    _styles_index.pop(name, None)
+    if current_style == name:
+        current_style = None
+    return jsonify({"success": True, "message": f"风格 '{name}' 已删除"})
 
 
 @app.route('/api/styles/current', methods=['GET'])
@@ -452,12 +658,7 @@ def set_current_style():
     
     if name:
         # 验证风格存在
-        found = False
-        for f in os.listdir(STYLES_DIR):
-            if os.path.splitext(f)[0] == name:
-                found = True
-                break
-        if not found:
+        if _get_style_path(name) is None:
             return jsonify({"success": False, "error": f"风格 '{name}' 不存在"})
     
     current_style = name
@@ -470,7 +671,18 @@ def set_current_style():
 @app.route('/styles/<path:filename>')
 def serve_style(filename):
     """提供风格图片静态文件服务"""
-    return send_from_directory(STYLES_DIR, filename)
+    return send_revalidated(STYLES_DIR, filename)
+
+
+def send_revalidated(directory: str, filename: str):
+    """
+    发送可能被重新生成的文件 (同名覆盖)
+    带 ETag/Last-Modified 且要求浏览器每次重新验证，文件未变化时返回 304 空响应
+    """
+    response = send_from_directory(directory, filename, conditional=True, etag=True, max_age=0)
+    response.cache_control.no_cache = True
+    response.cache_control.must_revalidate = True
+    return response
 
 
 @app.route('/api/config/test-image-api', methods=['POST'])
@@ -511,8 +723,6 @@ def test_image_api():
 @app.route('/api/optimize/video-prompt', methods=['POST'])
 def optimize_video_prompt():
     """使用 AI 优化视频提示词"""
-    import requests as req
-    
     data = request.get_json()
     page_index = data.get("page_index")
     old_prompt = data.get("video_prompt", "")
@@ -523,7 +733,7 @@ def optimize_video_prompt():
         return jsonify({"success": False, "error": "视频提示词为空"})
     
     # 获取优化 API 配置
-    opt_config = config.to_dict().get("optimize_api", {})
+    opt_config = config.snapshot().get("optimize_api", {})
     base_url = opt_config.get("base_url", "").rstrip('/')
     api_key = opt_config.get("api_key", "")
     model = opt_config.get("model", "gpt-4.1-mini")
@@ -537,12 +747,9 @@ def optimize_video_prompt():
     prompt_text = template.replace("{prompt}", old_prompt).replace("{narration}", eng_narration).replace("{image_prompt}", image_prompt)
     
     try:
-        resp = req.post(
+        resp = _opt_session.post(
             f"{base_url}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
+            headers={"Authorization": f"Bearer {api_key}"},
             json={
                 "model": model,
                 "messages": [
@@ -576,8 +783,6 @@ def optimize_video_prompt():
 @app.route('/api/optimize/image-prompt', methods=['POST'])
 def optimize_image_prompt():
     """使用 AI 优化图片提示词"""
-    import requests as req
-    
     data = request.get_json()
     page_index = data.get("page_index")
     old_prompt = data.get("image_prompt", "")
@@ -588,7 +793,7 @@ def optimize_image_prompt():
         return jsonify({"success": False, "error": "图片提示词为空"})
     
     # 获取优化 API 配置
-    opt_config = config.to_dict().get("optimize_api", {})
+    opt_config = config.snapshot().get("optimize_api", {})
     base_url = opt_config.get("base_url", "").rstrip('/')
     api_key = opt_config.get("api_key", "")
     model = opt_config.get("model", "gpt-4.1-mini")
@@ -602,12 +807,9 @@ def optimize_image_prompt():
     prompt_text = template.replace("{prompt}", old_prompt).replace("{narration}", eng_narration).replace("{video_prompt}", video_prompt)
     
     try:
-        resp = req.post(
+        resp = _opt_session.post(
             f"{base_url}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            },
+            headers={"Authorization": f"Bearer {api_key}"},
             json={
                 "model": model,
                 "messages": [
@@ -648,14 +850,14 @@ def index():
 @app.route('/static/<path:filename>')
 def serve_static(filename):
     """提供静态文件"""
-    return send_from_directory('static', filename)
+    return send_from_directory('static', filename, conditional=True)
 
 
 @app.route('/output/<path:filename>')
 def serve_output(filename):
     """提供生成的图片/视频文件"""
-    output_dir = os.path.join(os.path.dirname(__file__), "output")
-    return send_from_directory(output_dir, filename)
+    # conditional: 支持 Range 请求 (视频拖动进度条无需重新下载整个文件) 和 304
+    return send_revalidated(OUTPUT_DIR, filename)
 
 
 # ===== 故事数据 API =====
@@ -663,13 +865,10 @@ def serve_output(filename):
 @app.route('/api/story', methods=['GET'])
 def get_story():
     """获取故事数据"""
-    if story_data is None:
-        load_story_data()
-    
     if story_data is None:
         return jsonify({"success": False, "error": "无法加载故事数据"})
     
-    return jsonify({
+    return fast_jsonify({
         "success": True,
         "data": {
             "title": story_data.get("title", ""),
@@ -696,26 +895,13 @@ def upload_story():
         if not raw_json.strip():
             return jsonify({"success": False, "error": "JSON 内容为空"})
         
-        # 自动修复常见格式问题
-        fixed_json = fix_json_content(raw_json)
-        
-        # 解析 JSON
-        parsed_data = json.loads(fixed_json)
+        # 自动修复常见格式问题后解析 (不保留修复后的中间字符串)
+        parsed_data = json_loads(fix_json_content(raw_json))
         
         # 验证必要字段
-        if "title" not in parsed_data:
-            return jsonify({"success": False, "error": "缺少必要字段: title"})
-        if "script" not in parsed_data or not isinstance(parsed_data["script"], list):
-            return jsonify({"success": False, "error": "缺少必要字段: script (必须是数组)"})
-        if len(parsed_data["script"]) == 0:
-            return jsonify({"success": False, "error": "script 数组为空"})
-        
-        # 验证 script 中每个页面的必要字段
-        for i, page in enumerate(parsed_data["script"]):
-            if "page_index" not in page:
-                return jsonify({"success": False, "error": f"第 {i+1} 页缺少 page_index 字段"})
-            if "image_prompt" not in page:
-                return jsonify({"success": False, "error": f"第 {page.get('page_index', i+1)} 页缺少 image_prompt 字段"})
+        error = validate_story_data(parsed_data)
+        if error:
+            return jsonify({"success": False, "error": error})
         
         # 保存数据
         story_data = parsed_data
@@ -747,35 +933,86 @@ def upload_story():
         })
 
 
+def validate_story_data(data) -> str | None:
+    """校验故事数据的必要字段 (单次遍历)，返回错误信息，通过时返回 None"""
+    if not isinstance(data, dict) or "title" not in data:
+        return "缺少必要字段: title"
+    
+    script = data.get("script")
+    if not isinstance(script, list):
+        return "缺少必要字段: script (必须是数组)"
+    if not script:
+        return "script 数组为空"
+    
+    # 验证 script 中每个页面的必要字段
+    for i, page in enumerate(script):
+        if not isinstance(page, dict) or "page_index" not in page:
+            return f"第 {i+1} 页缺少 page_index 字段"
+        if "image_prompt" not in page:
+            return f"第 {page['page_index']} 页缺少 image_prompt 字段"
+    return None
+
+
 def save_story_to_project():
     """将故事数据保存到项目文件夹"""
     if story_data and current_project_dir:
         save_path = os.path.join(current_project_dir, "story.json")
-        with open(save_path, "w", encoding="utf-8") as f:
-            json.dump(story_data, f, ensure_ascii=False, indent=2)
+        with open(save_path, "wb") as f:
+            f.write(json_dumps_bytes(story_data, indent=True))
+        _write_project_meta(current_project_dir, story_data)
         print(f"📁 故事数据已保存至: {save_path}")
 
 
+def _write_project_meta(project_dir: str, data: dict) -> dict:
+    """写入项目摘要 meta.json ({title, pages})，供项目列表快速读取"""
+    meta = {
+        "title": data.get("title", os.path.basename(project_dir)),
+        "pages": len(data.get("script", []))
+    }
+    try:
+        with open(os.path.join(project_dir, "meta.json"), "wb") as f:
+            f.write(json_dumps_bytes(meta))
+    except OSError as e:
+        print(f"⚠️ 写入项目摘要失败 {project_dir}: {e}")
+    return meta
+
+
+def _read_project_meta(project_dir: str, story_path: str) -> dict:
+    """
+    读取项目摘要
+    meta.json 不存在或比 story.json 旧时，回退到解析完整 story.json 并重新生成摘要
+    """
+    meta_path = os.path.join(project_dir, "meta.json")
+    try:
+        if os.stat(meta_path).st_mtime_ns >= os.stat(story_path).st_mtime_ns:
+            with open(meta_path, "rb") as f:
+                return json_loads(f.read())
+    except (OSError, ValueError):
+        pass
+    
+    with open(story_path, "rb") as f:
+        data = json_loads(f.read())
+    return _write_project_meta(project_dir, data)
+
+
 @app.route('/api/projects', methods=['GET'])
 def list_projects():
     """列出所有已有项目"""
-    output_dir = os.path.join(os.path.dirname(__file__), "output")
     projects = []
     
-    if os.path.exists(output_dir):
-        for name in os.listdir(output_dir):
-            project_path = os.path.join(output_dir, name)
+    if os.path.exists(OUTPUT_DIR):
+        for name in os.listdir(OUTPUT_DIR):
+            project_path = os.path.join(OUTPUT_DIR, name)
             story_path = os.path.join(project_path, "story.json")
             
             if os.path.isdir(project_path) and os.path.exists(story_path):
-                # 读取项目标题
+                # 读取项目标题 (优先使用 meta.json 摘要)
                 try:
-                    with open(story_path, "r", encoding="utf-8") as f:
-                        data = json.load(f)
+                    meta = _read_project_meta(project_path, story_path)
                     projects.append({
                         "name": name,
-                        "title": data.get("title", name),
-                        "pages": len(data.get("script", []))
+                        "title": meta.get("title", name),
+                        "pages": meta.get("pages", 0)
                     })
                 except:
                     projects.append({
@@ -802,15 +1039,18 @@ def switch_project():
     if not project_name:
         return jsonify({"success": False, "error": "项目名称不能为空"})
     
-    output_dir = os.path.join(os.path.dirname(__file__), "output")
-    story_path = os.path.join(output_dir, project_name, "story.json")
+    # 安全检查：只允许切换到 output 下的一级目录
+    if _BAD_PROJECT_RE.search(project_name):
+        return jsonify({"success": False, "error": "非法的项目名称"})
+    
+    story_path = os.path.join(OUTPUT_DIR, project_name, "story.json")
     
     if not os.path.exists(story_path):
         return jsonify({"success": False, "error": f"项目 {project_name} 不存在"})
     
     try:
-        with open(story_path, "r", encoding="utf-8") as f:
-            story_data = json.load(f)
+        with open(story_path, "rb") as f:
+            story_data = json_loads(f.read())
         
         reset_generation_status()
         init_project_from_story()
@@ -828,8 +1068,9 @@ def switch_project():
 @app.route('/api/project/delete', methods=['POST'])
 def delete_project():
     """删除指定项目"""
-    global story_data, current_project_name, current_project_dir, generation_status
-    import shutil
+    global story_data, current_project_name, current_project_dir, generation_status, page_index_map
+    global current_images_dir, current_videos_dir, current_audio_dir
+    global current_char_sheet_path, current_scene_sheet_path, current_page_image_paths
     
     data = request.get_json()
     project_name = data.get("project_name", "")
@@ -838,11 +1079,10 @@ def delete_project():
         return jsonify({"success": False, "error": "项目名称不能为空"})
     
     # 安全检查：只允许删除 output 下的一级目录
-    if ".." in project_name or "/" in project_name or "\\" in project_name:
+    if _BAD_PROJECT_RE.search(project_name):
          return jsonify({"success": False, "error": "非法的项目名称"})
 
-    output_dir = os.path.join(os.path.dirname(__file__), "output")
-    target_dir = os.path.join(output_dir, project_name)
+    target_dir = os.path.join(OUTPUT_DIR, project_name)
     
     if not os.path.exists(target_dir):
         return jsonify({"success": False, "error": "项目不存在"})
@@ -855,8 +1095,12 @@ def delete_project():
         # 如果删除的是当前项目，重置状态
         if current_project_name == project_name:
             story_data = None
+            page_index_map = {}
             current_project_name = None
             current_project_dir = None
+            current_images_dir = current_videos_dir = current_audio_dir = None
+            current_char_sheet_path = current_scene_sheet_path = None
+            current_page_image_paths = {}
             reset_generation_status()
         
         return jsonify({
@@ -885,12 +1129,10 @@ def update_prompt():
         return jsonify({"success": False, "error": "缺少必要参数"})
     
     # 更新 story_data
-    for page in story_data.get("script", []):
-        if page["page_index"] == page_index:
-            page[prompt_type] = new_value
-            break
-    else:
+    page = page_index_map.get(page_index)
+    if page is None:
         return jsonify({"success": False, "error": f"未找到第 {page_index} 页"})
+    page[prompt_type] = new_value
     
     # 保存到文件
     save_story_to_project()
@@ -904,47 +1146,58 @@ def update_prompt():
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """获取生成状态"""
-    # 检查文件是否存在，更新状态
-    if os.path.exists(image_gen.get_character_sheet_path()):
+    # 检查文件是否存在，更新状态 (每个目录只扫描一次)
+    root_files = _dir_files(image_gen.output_dir)
+    img_files = _dir_files(os.path.join(image_gen.output_dir, "images"))
+    vid_files = _dir_files(video_gen.output_dir)
+    
+    has_char = "character_sheet.png" in root_files
+    has_scene = "scene_sheet.png" in root_files
+    has_item = "item_sheet.png" in root_files
+    
+    if has_char:
         if generation_status["character_sheet"] != "generating":
             generation_status["character_sheet"] = "completed"
     
-    if os.path.exists(image_gen.get_scene_sheet_path()):
+    if has_scene:
         if generation_status["scene_sheet"] != "generating":
             generation_status["scene_sheet"] = "completed"
 
-    if os.path.exists(os.path.join(image_gen.output_dir, "item_sheet.png")):
+    if has_item:
         if generation_status["item_sheet"] != "generating":
             generation_status["item_sheet"] = "completed"
     
-    # 检查每页图片
-    for idx in generation_status["pages"]:
-        img_path = image_gen.get_page_image_path(idx)
-        if os.path.exists(img_path):
-            if generation_status["pages"][idx]["image"] != "generating":
-                generation_status["pages"][idx]["image"] = "completed"
-        
-        vid_path = video_gen.get_video_path(idx)
-        if os.path.exists(vid_path):
-            if generation_status["pages"][idx]["video"] != "generating":
-                generation_status["pages"][idx]["video"] = "completed"
+    # 检查每页图片 (持锁遍历并写时复制，同时取一份一致的状态快照用于响应)
+    with _state_lock:
+        pages = generation_status["pages"]
+        for idx, entry in list(pages.items()):
+            image_done = f"page_{idx:03d}.png" in img_files and entry.get("image") not in ("generating", "completed")
+            video_done = f"page_{idx:03d}.mp4" in vid_files and entry.get("video") not in ("generating", "completed")
+            if image_done or video_done:
+                entry = dict(entry)
+                if image_done:
+                    entry["image"] = "completed"
+                if video_done:
+                    entry["video"] = "completed"
+                pages[idx] = entry
+        status_snapshot = dict(generation_status, pages=dict(pages))
     
     # 构建带项目目录的路径
     char_path = None
     scene_path = None
     
-    if current_project_name and os.path.exists(image_gen.get_character_sheet_path()):
+    if current_project_name and has_char:
         char_path = f"/output/{current_project_name}/character_sheet.png"
-    if current_project_name and os.path.exists(image_gen.get_scene_sheet_path()):
+    if current_project_name and has_scene:
         scene_path = f"/output/{current_project_name}/scene_sheet.png"
     
     item_path = None
-    if current_project_name and os.path.exists(os.path.join(image_gen.output_dir, "item_sheet.png")):
+    if current_project_name and has_item:
         item_path = f"/output/{current_project_name}/item_sheet.png"
     
-    return jsonify({
+    return fast_jsonify({
         "success": True,
-        "status": generation_status,
+        "status": status_snapshot,
         "project_name": current_project_name,
         "paths": {
             "character_sheet": char_path,
@@ -969,17 +1222,15 @@ def generate_character_sheet():
     # [NEW] 使用风格图作为参考
     ref_images = []
     if current_style:
-        for f in os.listdir(STYLES_DIR):
-            if os.path.splitext(f)[0] == current_style:
-                style_path = os.path.join(STYLES_DIR, f)
-                if os.path.exists(style_path):
-                    ref_images.append(style_path)
-                break
+        style_path = _get_style_path(current_style)
+        if style_path and os.path.exists(style_path):
+            ref_images.append(style_path)
     
+    gen = get_active_image_gen()
     if ref_images:
-        result = get_active_image_gen().generate_with_reference(prompt, ref_images, "character_sheet")
+        result = gen.generate_with_reference(prompt, ref_images, "character_sheet")
     else:
-        result = get_active_image_gen().generate_text_to_image(prompt, "character_sheet")
+        result = gen.generate_text_to_image(prompt, "character_sheet")
     
     if result["success"]:
         generation_status["character_sheet"] = "completed"
@@ -1011,17 +1262,13 @@ def generate_scene_sheet():
     
     # 1. 风格图
     if current_style:
-        for f in os.listdir(STYLES_DIR):
-            if os.path.splitext(f)[0] == current_style:
-                style_path = os.path.join(STYLES_DIR, f)
-                if os.path.exists(style_path):
-                    ref_images.append(style_path)
-                break
+        style_path = _get_style_path(current_style)
+        if style_path and os.path.exists(style_path):
+            ref_images.append(style_path)
     
     # 2. 角色设计稿
-    char_sheet_path = get_active_image_gen().get_character_sheet_path()
-    if os.path.exists(char_sheet_path):
-        ref_images.append(char_sheet_path)
+    if os.path.exists(current_char_sheet_path):
+        ref_images.append(current_char_sheet_path)
     
     result = get_active_image_gen().generate_with_reference(prompt, ref_images, "scene_sheet")
     
@@ -1053,17 +1300,13 @@ def generate_item_sheet():
     
     # 1. 风格图
     if current_style:
-        for f in os.listdir(STYLES_DIR):
-            if os.path.splitext(f)[0] == current_style:
-                style_path = os.path.join(STYLES_DIR, f)
-                if os.path.exists(style_path):
-                    ref_images.append(style_path)
-                break
+        style_path = _get_style_path(current_style)
+        if style_path and os.path.exists(style_path):
+            ref_images.append(style_path)
     
     # 2. 角色设计稿 (可选，作为参考以保持风格一致)
-    char_sheet_path = get_active_image_gen().get_character_sheet_path()
-    if os.path.exists(char_sheet_path):
-        ref_images.append(char_sheet_path)
+    if os.path.exists(current_char_sheet_path):
+        ref_images.append(current_char_sheet_path)
     
     result = get_active_image_gen().generate_with_reference(prompt, ref_images, "item_sheet")
     
@@ -1089,12 +1332,7 @@ def generate_page_image(page_index):
         return jsonify({"success": False, "error": "故事数据未加载"})
     
     # 查找对应页面
-    page = None
-    for p in story_data.get("script", []):
-        if p["page_index"] == page_index:
-            page = p
-            break
-    
+    page = page_index_map.get(page_index)
     if page is None:
         return jsonify({"success": False, "error": f"页面 {page_index} 不存在"})
     
@@ -1102,14 +1340,12 @@ def generate_page_image(page_index):
     ref_images = []
     
     # 1. 角色设计稿
-    char_sheet = get_active_image_gen().get_character_sheet_path()
-    if os.path.exists(char_sheet):
-        ref_images.append(char_sheet)
+    if os.path.exists(current_char_sheet_path):
+        ref_images.append(current_char_sheet_path)
     
     # 2. 场景设计稿
-    scene_sheet = get_active_image_gen().get_scene_sheet_path()
-    if os.path.exists(scene_sheet):
-        ref_images.append(scene_sheet)
+    if os.path.exists(current_scene_sheet_path):
+        ref_images.append(current_scene_sheet_path)
     
     if not ref_images:
         return jsonify({
@@ -1119,7 +1355,7 @@ def generate_page_image(page_index):
     
     # 3. 前一张分镜图片（仅一张）
     if page_index > 1:
-        prev_img_path = get_active_image_gen().get_page_image_path(page_index - 1)
+        prev_img_path = current_page_image_paths.get(page_index - 1) or image_gen.get_page_image_path(page_index - 1)
         if os.path.exists(prev_img_path):
             ref_images.append(prev_img_path)
     
@@ -1129,37 +1365,39 @@ def generate_page_image(page_index):
     batch_size = config.get("generation", "batch_size") or 1
     
     # 标记状态
-    if page_index not in generation_status["pages"]:
-         generation_status["pages"][page_index] = {"image": None, "video": None, "selected": False}
-    generation_status["pages"][page_index]["image"] = "generating"
+    _set_page_status(page_index, "image", "generating")
     
     try:
         last_result = None
         success_count = 0
         
-        success_count = 0
-        
         # [NEW] 重新生成前清理旧文件 (强制刷新)
-        old_images = glob.glob(f"output/{current_project_name}/images/page_{page_index:03d}*.png")
+        # [PERF] 一次 os.scandir 按前缀筛选，DirEntry 自带文件名，无需 glob 逐个 stat
+        prefix = f"page_{page_index:03d}"
+        old_images = []
+        try:
+            with os.scandir(current_images_dir) as it:
+                old_images = [e.path for e in it if e.name.startswith(prefix) and e.name.endswith(".png")]
+        except FileNotFoundError:
+            pass
         if old_images:
             print(f"🧹 清理旧文件: {len(old_images)} 个")
             for f in old_images:
                 try:
-                    os.remove(f)
-                except Exception as e:
+                    os.unlink(f)
+                except OSError as e:
                     print(f"⚠️ 删除旧文件失败 {f}: {e}")
         
-        # 循环生成
-        for i in range(batch_size):
-            # 第一张图使用标准文件名 page_001
-            # 后续图片使用变体文件名 page_001_var1, page_001_var2
-            suffix = "" if i == 0 else f"_var{i}"
-            filename = f"page_{page_index:03d}{suffix}"
-            
-            print(f"🔄 正在生成第 {page_index} 页 ({i+1}/{batch_size})... -> {filename}")
-            
-            result = get_active_image_gen().generate_with_reference(page["image_prompt"], ref_images, filename)
-            
+        # 第一张图使用标准文件名 page_001
+        # 后续图片使用变体文件名 page_001_var1, page_001_var2
+        filenames = [f"page_{page_index:03d}" + ("" if i == 0 else f"_var{i}") for i in range(batch_size)]
+        print(f"🔄 正在生成第 {page_index} 页 ({batch_size} 张)... -> {', '.join(filenames)}")
+        
+        # [PERF] 各变体使用相同的提示词和参考图、互相独立，并发请求
+        # (不同页之间不并发: 每页以前一页的图片作为参考)
+        gen = get_active_image_gen()
+        results = gen.generate_batch([(page["image_prompt"], ref_images, filename) for filename in filenames])
+        for i, result in enumerate(results):
             if result["success"]:
                 success_count += 1
                 last_result = result
@@ -1167,14 +1405,14 @@ def generate_page_image(page_index):
                 print(f"❌ 生成失败 ({i+1}/{batch_size}): {result.get('error')}")
         
         if success_count > 0:
-            generation_status["pages"][page_index]["image"] = "completed"
+            _set_page_status(page_index, "image", "completed")
             return jsonify({
                 "success": True,
                 "path": f"/output/{current_project_name}/images/page_{page_index:03d}.png",
                 "message": f"第 {page_index} 页生成成功 (共 {success_count} 张)"
             })
         else:
-            generation_status["pages"][page_index]["image"] = "failed"
+            _set_page_status(page_index, "image", "failed")
             error_msg = last_result["error"] if last_result else "未知错误"
             return jsonify({
                 "success": False,
@@ -1182,7 +1420,7 @@ def generate_page_image(page_index):
             })
     except Exception as e:
         print(f"⚠️ 生成页面图片异常: {e}")
-        generation_status["pages"][page_index]["image"] = "failed"
+        _set_page_status(page_index, "image", "failed")
         return jsonify({
             "success": False,
             "error": f"服务器内部错误: {str(e)}"
@@ -1192,25 +1430,24 @@ def generate_page_image(page_index):
 @app.route('/api/generate/page-video/<int:page_index>', methods=['POST'])
 def generate_page_video(page_index):
     """生成分镜视频"""
-    global active_video_tasks
-    active_video_tasks += 1
-    print(f"🎬 [Start] Video Task for Page {page_index} | Active Tasks: {active_video_tasks}")
+    active = _track_task("video", 1)
+    print(f"🎬 [Start] Video Task for Page {page_index} | Active Tasks: {active}")
     
     if story_data is None:
-        active_video_tasks -= 1
+        _track_task("video", -1)
         return jsonify({"success": False, "error": "故事数据未加载"})
     
-    page = next((p for p in story_data["script"] if p["page_index"] == page_index), None)
+    page = page_index_map.get(page_index)
     if not page:
-        active_video_tasks -= 1
+        _track_task("video", -1)
         return jsonify({"success": False, "error": "页码不存在"})
     
     # 状态更新
-    generation_status["pages"][page_index]["video"] = "generating"
+    _set_page_status(page_index, "video", "generating")
     
     try:
         # [NEW] 重新生成前清理旧视频
-        video_path = f"output/{current_project_name}/videos/page_{page_index:03d}.mp4"
+        video_path = os.path.join(current_videos_dir, f"page_{page_index:03d}.mp4")
         if os.path.exists(video_path):
              try:
                 os.remove(video_path)
@@ -1221,62 +1458,54 @@ def generate_page_video(page_index):
         prompt = page.get("video_prompt", "")
         result = video_gen.generate_video(
             prompt=prompt,
-            reference_image=f"output/{current_project_name}/images/page_{page_index:03d}.png",
+            reference_image=os.path.join(current_images_dir, f"page_{page_index:03d}.png"),
             filename=f"page_{page_index:03d}",
             force_regenerate=True
         )
         
         if result["success"]:
-            generation_status["pages"][page_index]["video"] = "completed"
-            active_video_tasks -= 1
-            print(f"✅ [End] Video Task for Page {page_index} | Active Tasks: {active_video_tasks}")
+            _set_page_status(page_index, "video", "completed")
+            active = _track_task("video", -1)
+            print(f"✅ [End] Video Task for Page {page_index} | Active Tasks: {active}")
             return jsonify({
                 "success": True, 
                 "video_path": f"/output/{current_project_name}/videos/page_{page_index:03d}.mp4",
                 "message": "视频生成成功"
             })
         else:
-            generation_status["pages"][page_index]["video"] = "failed"
-            active_video_tasks -= 1
-            print(f"❌ [Fail] Video Task for Page {page_index} | Active Tasks: {active_video_tasks}")
+            _set_page_status(page_index, "video", "failed")
+            active = _track_task("video", -1)
+            print(f"❌ [Fail] Video Task for Page {page_index} | Active Tasks: {active}")
             return jsonify({"success": False, "error": result["error"]})
 
     except Exception as e:
         print(f"视频生成异常: {e}")
-        generation_status["pages"][page_index]["video"] = "failed"
-        active_video_tasks -= 1
+        _set_page_status(page_index, "video", "failed")
+        _track_task("video", -1)
         return jsonify({"success": False, "error": str(e)})
 
 
 @app.route('/api/generate/page-audio/<int:page_index>', methods=['POST'])
 def generate_page_audio(page_index):
     """生成分镜音频"""
-    global active_audio_tasks
-    active_audio_tasks += 1
+    active = _track_task("audio", 1)
     
     # 获取语言参数
     lang = request.args.get('lang', 'cn') # 'cn' or 'en'
     
-    print(f"🔊 [Start] Audio Task for Page {page_index} ({lang}) | Active Tasks: {active_audio_tasks}")
+    print(f"🔊 [Start] Audio Task for Page {page_index} ({lang}) | Active Tasks: {active}")
 
     if story_data is None:
-        active_audio_tasks -= 1
+        _track_task("audio", -1)
         return jsonify({"success": False, "error": "故事数据未加载"})
     
-    page = next((p for p in story_data["script"] if p["page_index"] == page_index), None)
+    page = page_index_map.get(page_index)
     if not page:
-        active_audio_tasks -= 1
+        _track_task("audio", -1)
         return jsonify({"success": False, "error": "页码不存在"})
         
-    # 状态更新 (字典结构)
-    if generation_status["pages"][page_index]["audio"] is None:
-         generation_status["pages"][page_index]["audio"] = {"cn": None, "en": None}
-    
-    # 兼容旧状态如果是字符串的情况 (虽然 init 做了处理，以防万一)
-    if isinstance(generation_status["pages"][page_index]["audio"], str):
-         generation_status["pages"][page_index]["audio"] = {"cn": None, "en": None}
-         
-    generation_status["pages"][page_index]["audio"][lang] = "generating"
+    # 状态更新 (字典结构；None 或旧的字符串状态在 _set_page_status 中统一修正)
+    _set_page_status(page_index, "audio", "generating", lang=lang)
     
     try:
         # [FIX] 强制同步最新的 Audio 配置 (确保手动修改 config.json 生效)
@@ -1284,7 +1513,7 @@ def generate_page_audio(page_index):
         current_ref_audio = config.get("audio_api", "reference_audio")
         
         # 如果配置有变，或者为了保险起见，更新 audio_gen
-        if current_api_url != audio_gen.api_url or current_ref_audio != audio_gen.default_ref_audio:
+        if (current_api_url or "").rstrip('/') != audio_gen.api_url or current_ref_audio != audio_gen.default_ref_audio:
             print(f"🔄 Syncing Audio Config: {current_api_url}")
             audio_gen.update_config(current_api_url, current_ref_audio)
 
@@ -1292,7 +1521,7 @@ def generate_page_audio(page_index):
         filename_suffix = "en" if lang == "en" else "cn"
         text_key = "eng_narration" if lang == "en" else "narration"
         
-        audio_path = f"output/{current_project_name}/audio/page_{page_index:03d}_{filename_suffix}.wav"
+        audio_path = os.path.join(current_audio_dir, f"page_{page_index:03d}_{filename_suffix}.wav")
         
         # 清理旧音频
         if os.path.exists(audio_path):
@@ -1304,7 +1533,7 @@ def generate_page_audio(page_index):
         # 朗读文本
         text = page.get(text_key, "")
         if not text:
-             active_audio_tasks -= 1
+             _track_task("audio", -1)
              return jsonify({"success": False, "error": f"{lang} 旁白为空"})
 
         # 根据语言选择参考音频
@@ -1320,25 +1549,24 @@ def generate_page_audio(page_index):
         )
         
         if result["success"]:
-            generation_status["pages"][page_index]["audio"][lang] = "completed"
-            active_audio_tasks -= 1
-            print(f"✅ [End] Audio Task for Page {page_index} ({lang}) | Active Tasks: {active_audio_tasks}")
+            _set_page_status(page_index, "audio", "completed", lang=lang)
+            active = _track_task("audio", -1)
+            print(f"✅ [End] Audio Task for Page {page_index} ({lang}) | Active Tasks: {active}")
             return jsonify({
                 "success": True,
                 "audio_path": f"/output/{current_project_name}/audio/page_{page_index:03d}_{filename_suffix}.wav",
                 "message": f"{lang.upper()} 音频生成成功"
             })
         else:
-            generation_status["pages"][page_index]["audio"][lang] = "failed"
-            active_audio_tasks -= 1
-            print(f"❌ [Fail] Audio Task for Page {page_index} ({lang}) | Active Tasks: {active_audio_tasks}")
+            _set_page_status(page_index, "audio", "failed", lang=lang)
+            active = _track_task("audio", -1)
+            print(f"❌ [Fail] Audio Task for Page {page_index} ({lang}) | Active Tasks: {active}")
             return jsonify({"success": False, "error": result["error"]})
             
     except Exception as e:
         print(f"音频生成异常: {e}")
-        if isinstance(generation_status["pages"][page_index]["audio"], dict):
-            generation_status["pages"][page_index]["audio"][lang] = "failed"
-        active_audio_tasks -= 1
+        _set_page_status(page_index, "audio", "failed", lang=lang)
+        _track_task("audio", -1)
         return jsonify({"success": False, "error": str(e)})
 
 
@@ -1351,25 +1579,16 @@ def generate_project_srt():
     generation_status["srt"] = "generating"
     
     try:
-        audio_dir = f"output/{current_project_name}/audio"
+        audio_dir = current_audio_dir
+        pages = story_data["script"]
+        srt_cn_path = os.path.join(current_project_dir, f"{current_project_name}_cn.srt")
+        srt_en_path = os.path.join(current_project_dir, f"{current_project_name}_en.srt")
         
-        # 1. 生成中文 SRT
-        srt_cn_path = f"output/{current_project_name}/{current_project_name}_cn.srt"
-        res_cn = audio_gen.generate_project_srt(
-            pages=story_data["script"],
-            audio_dir=audio_dir,
-            output_srt_path=srt_cn_path,
-            lang="cn"
-        )
-        
-        # 2. 生成英文 SRT
-        srt_en_path = f"output/{current_project_name}/{current_project_name}_en.srt"
-        res_en = audio_gen.generate_project_srt(
-            pages=story_data["script"],
-            audio_dir=audio_dir,
-            output_srt_path=srt_en_path,
-            lang="en"
-        )
+        # [PERF] 中英文 SRT 互不依赖，并行生成 (重叠 WAV 头读取等 I/O)
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            f_cn = ex.submit(audio_gen.generate_project_srt, pages, audio_dir, srt_cn_path, "cn")
+            f_en = ex.submit(audio_gen.generate_project_srt, pages, audio_dir, srt_en_path, "en")
+            res_cn, res_en = f_cn.result(), f_en.result()
         
         if res_cn["success"] and res_en["success"]:
             generation_status["srt"] = "completed"
@@ -1392,11 +1611,12 @@ def generate_project_srt():
         return jsonify({"success": False, "error": str(e)})
 def toggle_select(page_index):
     """切换页面选中状态"""
-    if page_index not in generation_status["pages"]:
-        generation_status["pages"][page_index] = {"image": None, "video": None, "selected": False}
-    
-    current = generation_status["pages"][page_index]["selected"]
-    generation_status["pages"][page_index]["selected"] = not current
+    with _state_lock:
+        pages = generation_status["pages"]
+        entry = dict(pages.get(page_index) or _new_page_status())
+        current = entry.get("selected", False)
+        entry["selected"] = not current
+        pages[page_index] = entry
     
     return jsonify({
         "success": True,
@@ -1411,7 +1631,7 @@ def generate_all_images():
         return jsonify({"success": False, "error": "故事数据未加载"})
     
     # 检查设计稿
-    if not os.path.exists(image_gen.get_character_sheet_path()):
+    if not os.path.exists(current_char_sheet_path):
         return jsonify({"success": False, "error": "请先生成角色设计稿"})
     
     results = []
@@ -1479,7 +1699,7 @@ def generate_final_video():
     data = request.get_json() or {}
     
     # 从配置读取后处理参数
-    post_config = config.to_dict().get("video_post_processing", {})
+    post_config = config.snapshot().get("video_post_processing", {})
     
     scene_threshold = data.get("scene_threshold") or post_config.get("scene_threshold", 27.0)
     video_volume = data.get("video_volume") or post_config.get("video_volume", 0.05)
@@ -1490,8 +1710,8 @@ def generate_final_video():
     lang = data.get("lang", "cn")
     lang_suffix = "_cn" if lang == "cn" else "_en"
     
-    video_folder = os.path.join(current_project_dir, "videos")
-    audio_folder = os.path.join(current_project_dir, "audio")
+    video_folder = current_videos_dir
+    audio_folder = current_audio_dir
     temp_folder = os.path.join(current_project_dir, "temp_merge")
     # [修改] 文件名包含语言后缀
     final_filename = f"{current_project_name}_final{lang_suffix}.mp4"
@@ -1563,12 +1783,12 @@ def generate_final_video():
             return jsonify({"success": False, "error": "视频处理失败，请检查日志"})
             
     except Exception as e:
-        import traceback
         traceback.print_exc()
         return jsonify({"success": False, "error": f"生成失败: {str(e)}"})
 
 
 if __name__ == '__main__':
+    ensure_story_loaded()
     print("=" * 50)
     print("儿童故事图片视频生成工具")
     print("=" * 50)
@@ -1580,4 +1800,19 @@ if __name__ == '__main__':
     print("=" * 50)
     print("启动服务器: http://localhost:5000")
     print("=" * 100)
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    
+    # 后台预热 TTS 连接，首个配音请求无需等待握手
+    audio_gen.start_warm_up()
+    
+    # [PERF] 优先使用生产级 WSGI 服务器 (waitress，跨平台)，多线程处理长耗时的生成请求
+    # 生成状态保存在进程内存中，只能单进程多线程运行 (gunicorn 需 -w 1 --threads N -k gthread)
+    threads = config.get("server", "threads") or 16
+    try:
+        from waitress import serve
+    except ImportError:
+        # 调试模式仅在配置中显式开启；始终关闭重载器 (它会定时 stat 所有源文件)
+        app.run(host='0.0.0.0', port=5000, debug=bool(config.get("server", "debug")),
+                threaded=True, use_reloader=False)
+    else:
+        print(f"🚀 使用 waitress 运行 (threads={threads})")
+        serve(app, host='0.0.0.0', port=5000, threads=threads)
@@ -6,9 +6,57 @@ import wave
 import contextlib
 import struct
 import math
+import array
+import sys
+import time
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from gradio_client import Client, handle_file
 
+# [PERF] NumPy 可选: 用于向量化淡出处理，缺失时回退到 array 逐样本处理
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# WAV 时长缓存: {(路径, mtime_ns, size): 秒}，LRU 淘汰；文件被重新生成后 mtime/size 变化自动失效
+_DURATION_CACHE_MAX = 1024
+_duration_cache = OrderedDict()
+_duration_lock = threading.Lock()
+
+_CN_DIGITS = ("零", "一", "二", "三", "四", "五", "六", "七", "八", "九")
+_CN_UNITS = ("", "十", "百", "千", "万")
+
+
+@lru_cache(maxsize=1024)
+def _arabic_to_chinese(number: int) -> str:
+    """整数转中文数字 (旁白中的数字大量重复，结果缓存)"""
+    if number == 0: return "零"
+    if number == 2: return "两"
+    s_num = str(number)
+    length = len(s_num)
+    parts = []
+    for i, d in enumerate(s_num):
+        digit = ord(d) - 48
+        if digit != 0:
+            parts.append(_CN_DIGITS[digit])
+            parts.append(_CN_UNITS[length - i - 1])
+        elif parts and parts[-1] != "零":
+            parts.append("零")
+    while parts and parts[-1] == "零":
+        parts.pop()
+    result = "".join(parts)
+    if 10 <= number < 20 and result.startswith("一十"):
+        result = result[1:]
+    return result
+
+
 class AudioGenerator:
+    # [PERF] 预编译正则，避免每次调用查找 re 模块缓存
+    _NUM_RE = re.compile(r'\d+')
+    _PUNCT_RE = re.compile(r'([。！？?!；;，,、\n]+)')
+
     def __init__(self, api_url: str, default_ref_audio: str = None):
         """
         初始化音频生成器
@@ -18,128 +66,199 @@ class AudioGenerator:
         self.api_url = api_url.rstrip('/')
         self.default_ref_audio = default_ref_audio
         self.client = None
+        self._client_lock = threading.Lock()
+        self._ref_valid_cache = {}  # {参考音频路径: 最近一次确认存在的时间}
         
     def _get_client(self):
-        if not self.client:
-            print(f"Connecting to TTS API: {self.api_url}")
-            self.client = Client(self.api_url)
-        return self.client
+        client = self.client
+        if client:
+            return client
+        # 在锁外建立连接 (可能耗时到超时)，避免 update_config 等待；完成后在锁内换入
+        api_url = self.api_url
+        print(f"Connecting to TTS API: {api_url}")
+        client = Client(api_url)
+        with self._client_lock:
+            if not self.client and self.api_url == api_url:
+                self.client = client
+            return self.client if self.api_url == api_url else client
+
+    def warm_up(self):
+        """预先建立 TTS 连接 (失败时静默，首次调用时再重试)"""
+        try:
+            self._get_client()
+        except Exception as e:
+            print(f"TTS warm-up failed: {e}")
+
+    def start_warm_up(self):
+        """在后台线程中预热连接 (由调用方显式触发，如应用启动时)，首个请求无需等待握手"""
+        threading.Thread(target=self.warm_up, daemon=True).start()
+
+    def _ref_ok(self, ref_path, ttl: float = 5.0) -> bool:
+        """参考音频是否存在；确认存在后 ttl 秒内不再重复 stat (不存在的结果不缓存)"""
+        if not ref_path:
+            return False
+        now = time.monotonic()
+        checked = self._ref_valid_cache.get(ref_path)
+        if checked is not None and now - checked < ttl:
+            return True
+        if os.path.exists(ref_path):
+            self._ref_valid_cache[ref_path] = now
+            return True
+        self._ref_valid_cache.pop(ref_path, None)
+        return False
 
     def update_config(self, api_url: str, default_ref_audio: str):
-        """更新配置"""
-        if api_url and api_url != self.api_url:
-            self.api_url = api_url
-            self.client = None # Reset client
+        """更新配置 (仅在 URL 变化时重建客户端)"""
+        if api_url and api_url.rstrip('/') != self.api_url:
+            self.api_url = api_url.rstrip('/')
+            with self._client_lock:
+                self.client = None
         self.default_ref_audio = default_ref_audio
 
     # ================= 文本处理工具 =================
 
     def arabic_to_chinese(self, number):
         """将整数转换为中文数字字符串"""
-        number = int(number)
-        if number == 0: return "零"
-        if number == 2: return "两"
-        digits = {0: "零", 1: "一", 2: "二", 3: "三", 4: "四",
-                  5: "五", 6: "六", 7: "七", 8: "八", 9: "九"}
-        units = ["", "十", "百", "千", "万"]
-        s_num = str(number)
-        length = len(s_num)
-        result = ""
-        for i, d in enumerate(s_num):
-            digit = int(d)
-            if digit != 0:
-                result += digits[digit] + units[length - i - 1]
-            else:
-                if not result.endswith("零"):
-                    result += "零"
-        result = result.rstrip("零")
-        if 10 <= number < 20 and result.startswith("一十"):
-            result = result[1:]
-        return result
+        return _arabic_to_chinese(int(number))
 
     def text_convert_numbers(self, text):
-        return re.sub(r'\d+', lambda x: self.arabic_to_chinese(x.group()), text)
+        return self._NUM_RE.sub(lambda x: self.arabic_to_chinese(x.group()), text)
 
     def split_text_by_punctuation(self, text):
         """
         将文本按标点符号分割成列表，保留标点，合并到上一句中。
         """
-        pattern = r'([。！？?!；;，,、\n]+)'
-        parts = re.split(pattern, text)
-        sentences = []
-        current_sent = ""
-
-        for part in parts:
-            if not part: continue
-            if re.match(pattern, part):
-                current_sent += part
-                sentences.append(current_sent.strip())
-                current_sent = ""
-            else:
-                if current_sent:
-                    sentences.append(current_sent.strip())
-                    current_sent = ""
-                current_sent += part
+        # 带捕获组的 split 结果为 [文本, 标点, 文本, 标点, ..., 文本]，按对取出即可，无需逐段再匹配
+        parts = self._PUNCT_RE.split(text)
+        sentences = [(part + punct).strip() for part, punct in zip(parts[0::2], parts[1::2])]
 
-        if current_sent.strip():
-            sentences.append(current_sent.strip())
+        tail = parts[-1].strip()
+        if tail:
+            sentences.append(tail)
         return sentences
 
     # ================= 音频处理工具 =================
 
     def get_wav_duration(self, file_path):
-        """获取 WAV 文件的时长（秒）"""
-        with contextlib.closing(wave.open(str(file_path), 'r')) as f:
+        """获取 WAV 文件的时长（秒），按 (路径, mtime, size) 缓存"""
+        file_path = str(file_path)
+        st = os.stat(file_path)
+        key = (file_path, st.st_mtime_ns, st.st_size)
+        with _duration_lock:
+            duration = _duration_cache.get(key)
+            if duration is not None:
+                _duration_cache.move_to_end(key)
+                return duration
+
+        duration = self._read_wav_duration(file_path)
+
+        with _duration_lock:
+            _duration_cache[key] = duration
+            if len(_duration_cache) > _DURATION_CACHE_MAX:
+                _duration_cache.popitem(last=False)
+        return duration
+
+    def _read_wav_duration(self, file_path):
+        """从文件读取 WAV 时长: 优先解析头部，失败时回退到 wave 模块"""
+        try:
+            return self._wav_duration_fast(file_path)
+        except (OSError, ValueError, struct.error):
+            pass
+        with contextlib.closing(wave.open(file_path, 'r')) as f:
             frames = f.getnframes()
             rate = f.getframerate()
             return frames / float(rate)
 
+    def _wav_duration_fast(self, file_path):
+        """只解析 RIFF 头部 (fmt / data 块大小) 计算时长，不读音频数据"""
+        with open(file_path, 'rb') as f:
+            _, _, rate, block_align, _, data_size = self._read_wav_header(f)
+        return (data_size // block_align) / float(rate)
+
+    def _read_wav_header(self, f):
+        """
+        解析 RIFF/WAVE 头，跳过 fmt / data 以外的块
+        返回 (format_tag, nchannels, framerate, block_align, data_offset, data_size)，文件位置停在 data 块起始
+        """
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+            raise ValueError("not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError("data chunk not found")
+            chunk_id, size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack('<HHIIH', f.read(16)[:14])
+                f.seek(size - 16 + (size & 1), 1)
+            elif chunk_id == b'data':
+                if not fmt or not fmt[2] or not fmt[4]:
+                    raise ValueError("fmt chunk missing")
+                format_tag, nchannels, rate, _, block_align = fmt
+                return format_tag, nchannels, rate, block_align, f.tell(), size
+            else:
+                f.seek(size + (size & 1), 1)
+
     def seconds_to_srt_time(self, seconds):
         """将秒数转换为 SRT 时间戳格式 00:00:00,000"""
-        millis = int((seconds - int(seconds)) * 1000)
-        seconds = int(seconds)
+        # 先一次性换算为整数毫秒，之后全部整数运算 (避免 3.9999... 这类浮点误差)
+        millis = int(round(seconds * 1000))
+        seconds, millis = divmod(millis, 1000)
         minutes, seconds = divmod(seconds, 60)
         hours, minutes = divmod(minutes, 60)
         return f"{hours:02}:{minutes:02}:{seconds:02},{millis:03}"
 
     def apply_fadeout(self, file_path, duration_ms=200):
-        """使用纯 Python 对 WAV 文件末尾进行淡出处理"""
+        """对 WAV 文件末尾进行淡出处理 (只读写末尾淡出部分的 PCM 数据，原地改写)"""
         try:
-            file_path = str(file_path)
-            with wave.open(file_path, 'rb') as f:
-                params = f.getparams()
-                data = f.readframes(params.nframes)
-
-            if params.sampwidth != 2:
-                print(f"Skipping fadeout: unsupported sampwidth {params.sampwidth}")
-                return
-
-            fade_frames = int(params.framerate * duration_ms / 1000)
-            if fade_frames > params.nframes:
-                fade_frames = params.nframes
-
-            mutable_data = bytearray(data)
-            start_frame = params.nframes - fade_frames
-
-            for i in range(fade_frames):
-                factor = 1.0 - (i / fade_frames)
-                frame_offset = (start_frame + i) * params.nchannels * params.sampwidth
-                for ch in range(params.nchannels):
-                    idx = frame_offset + ch * 2
-                    try:
-                        sample = struct.unpack_from('<h', mutable_data, idx)[0]
-                        new_sample = int(sample * factor)
-                        struct.pack_into('<h', mutable_data, idx, new_sample)
-                    except:
-                        pass
-
-            with wave.open(file_path, 'wb') as f:
-                f.setparams(params)
-                f.writeframes(mutable_data)
+            with open(str(file_path), 'r+b') as f:
+                format_tag, nchannels, framerate, block_align, data_offset, data_size = self._read_wav_header(f)
+
+                sampwidth = block_align // nchannels if nchannels else 0
+                if format_tag not in (1, 0xFFFE) or sampwidth != 2:  # 仅处理 16-bit PCM
+                    print(f"Skipping fadeout: unsupported sampwidth {sampwidth}")
+                    return
+
+                # 以文件中实际存在的完整帧为准 (文件被截断时 data 块大小可能偏大)
+                available = os.fstat(f.fileno()).st_size - data_offset
+                nframes = min(data_size, available) // block_align
+
+                fade_frames = int(framerate * duration_ms / 1000)
+                if fade_frames > nframes:
+                    fade_frames = nframes
+                if fade_frames <= 0:
+                    return
+
+                tail_offset = data_offset + (nframes - fade_frames) * block_align
+                f.seek(tail_offset)
+                tail = f.read(fade_frames * block_align)
+                f.seek(tail_offset)
+                f.write(self._fade_tail(tail, fade_frames, nchannels))
                 
         except Exception as e:
             print(f"Fadeout failed: {e}")
 
+    def _fade_tail(self, data, fade_frames, nchannels):
+        """对 16-bit 小端 PCM 数据做线性淡出，返回处理后的字节"""
+        if np is not None:
+            tail = np.frombuffer(data, dtype='<i2').reshape(fade_frames, nchannels)
+            ramp = 1.0 - np.arange(fade_frames, dtype=np.float64) / fade_frames
+            # astype 向零截断，与 int() 行为一致
+            return (tail * ramp[:, None]).astype('<i2').tobytes()
+
+        samples = array.array('h', data)
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        for i in range(fade_frames):
+            factor = 1.0 - (i / fade_frames)
+            base = i * nchannels
+            for j in range(base, base + nchannels):
+                samples[j] = int(samples[j] * factor)
+        if sys.byteorder == 'big':
+            samples.byteswap()
+        return samples.tobytes()
+
     # ================= 核心生成逻辑 =================
 
     def generate_audio(self, text: str, output_path: str, ref_audio_path: str = None, lang: str = "cn") -> dict:
@@ -152,7 +271,7 @@ class AudioGenerator:
         :return: {success: bool, error: str, path: str}
         """
         ref_path = ref_audio_path or self.default_ref_audio
-        if not ref_path or not os.path.exists(ref_path):
+        if not self._ref_ok(ref_path):
              return {"success": False, "error": f"Reference audio not found: {ref_path}"}
 
         try:
@@ -190,8 +309,11 @@ class AudioGenerator:
             # 确保目录存在
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             
-            # 移动/复制文件
-            shutil.copy(temp_path, output_path)
+            # 移动文件: 同一文件系统时只是一次 rename，跨设备时回退为复制
+            try:
+                os.replace(temp_path, output_path)
+            except OSError:
+                shutil.copy(temp_path, output_path)
             
             # 应用淡出
             self.apply_fadeout(output_path, duration_ms=150)
@@ -216,24 +338,34 @@ class AudioGenerator:
         try:
             sorted_pages = sorted(pages, key=lambda x: x['page_index'])
             text_key = "eng_narration" if lang == "en" else "narration"
+            is_cn = lang == "cn"
+            
+            # 一次列出音频目录，代替每页多次 os.path.exists
+            try:
+                with os.scandir(audio_dir) as it:
+                    audio_files = {entry.name for entry in it}
+            except OSError:
+                audio_files = set()
 
             for page in sorted_pages:
                 idx = page['page_index']
                 # 文件名区分语言
                 filename_suffix = "en" if lang == "en" else "cn"
-                audio_path = os.path.join(audio_dir, f"page_{idx:03d}_{filename_suffix}.wav")
+                audio_name = f"page_{idx:03d}_{filename_suffix}.wav"
                 
                 # 兼容旧文件名 (cn)
-                if lang == "cn" and not os.path.exists(audio_path):
-                     legacy_path = os.path.join(audio_dir, f"page_{idx:03d}.wav")
-                     if os.path.exists(legacy_path):
-                         audio_path = legacy_path
+                if lang == "cn" and audio_name not in audio_files:
+                     legacy_name = f"page_{idx:03d}.wav"
+                     if legacy_name in audio_files:
+                         audio_name = legacy_name
 
                 text = page.get(text_key, '')
                 
-                if not os.path.exists(audio_path):
+                if audio_name not in audio_files:
                     print(f"Skip SRT for page {idx} ({lang}): Audio missing")
                     continue
+                
+                audio_path = os.path.join(audio_dir, audio_name)
                     
                 # 获取音频时长
                 duration = self.get_wav_duration(audio_path)
@@ -241,22 +373,17 @@ class AudioGenerator:
                 # 分割文本
                 sub_sentences = self.split_text_by_punctuation(text)
                 
-                # 计算权重
-                weights = []
-                for s in sub_sentences:
-                    if lang == "cn":
-                        spoken_s = self.text_convert_numbers(s)
-                    else:
-                        spoken_s = s
-                    weights.append(len(spoken_s))
-                
-                total_weight = sum(weights)
-                if total_weight == 0: total_weight = 1
+                # 计算权重 (中文按数字转读后的长度计)
+                if is_cn:
+                    weights = [len(self.text_convert_numbers(s)) for s in sub_sentences]
+                else:
+                    weights = [len(s) for s in sub_sentences]
+                total_weight = sum(weights) or 1
                 
                 # 生成字幕块
                 segment_start = current_time_cursor
-                for i, sub_text in enumerate(sub_sentences):
-                    seg_duration = duration * (weights[i] / total_weight)
+                for sub_text, weight in zip(sub_sentences, weights):
+                    seg_duration = duration * (weight / total_weight)
                     segment_end = segment_start + seg_duration
                     
                     start_str = self.seconds_to_srt_time(segment_start)
@@ -270,8 +397,11 @@ class AudioGenerator:
                 current_time_cursor += duration
                 
             # 保存 SRT
-            with open(output_srt_path, "w", encoding="utf-8") as f:
+            # 先写临时文件再原子替换，读取方 (视频合成) 不会读到写了一半的 SRT
+            tmp_path = f"{output_srt_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
                 f.write("\n".join(srt_content_list))
+            os.replace(tmp_path, output_srt_path)
                 
             return {"success": True, "path": output_srt_path}
             
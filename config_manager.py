@@ -5,9 +5,47 @@
 
 import os
 import json
-import copy
+import atexit
+import threading
+import time
 from pathlib import Path
 
+# [PERF] orjson 为可选依赖: 解析/序列化更快且直接输出 UTF-8 字节，缺失时回退到标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_loads(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _json_dumps_bytes(data) -> bytes:
+    """序列化为缩进 2 格、不转义中文的 UTF-8 JSON 字节"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+_MISSING = object()    # get() 扁平缓存未命中
+_NOT_FOUND = object()  # get() 扁平缓存中表示 "路径不存在"
+
+
+def _clone_json(o):
+    """
+    深拷贝纯 JSON 数据 (dict / list / 基本类型)
+    比 copy.deepcopy 快数倍: 不需要 memo 表和逐对象分派，不可变的基本类型直接复用
+    """
+    t = type(o)
+    if t is dict:
+        return {k: _clone_json(v) for k, v in o.items()}
+    if t is list:
+        return [_clone_json(v) for v in o]
+    return o
+
 
 class Config:
     """配置管理类"""
@@ -60,6 +98,11 @@ class Config:
             "video_volume": 0.05,         # 原视频音量 (0.05 = 5%)
             "audio_volume": 4.0,          # 配音音量 (4.0 = 400%)
             "skip_first_scene": True      # 是否删除第一个镜头
+        },
+        "server": {
+            "use_x_sendfile": False,      # 由前端服务器 (Apache mod_xsendfile / lighttpd) 通过 X-Sendfile 发送静态文件
+            "threads": 16,                # WSGI 服务器工作线程数
+            "debug": False                # Flask 调试模式 (仅开发环境开启)
         }
     }
     
@@ -75,6 +118,13 @@ class Config:
         
         self.config_path = config_path
         self.last_error = None # [NEW] 记录最近一次加载错误
+        self._snap = None       # 只读快照缓存 (见 snapshot)
+        self._snap_src = None   # 快照对应的 self.config 对象
+        self._flat_cache = {}   # get() 结果缓存: {键路径元组: 值}
+        self._file_sig = None   # 最近一次加载/保存时配置文件的 (mtime_ns, size)
+        self._dirty = False     # 内存中有尚未写盘的修改 (见 set / flush)
+        self._flusher = None    # 后台写盘线程，首次出现延迟写入时启动
+        self._lock = threading.RLock()  # 保护 self.config 的修改、序列化与重新加载 (Flask 多线程 + 后台写盘线程)
         self.config = self.load_config()
     
     def load_config(self) -> dict:
@@ -83,13 +133,15 @@ class Config:
         self.last_error = None # Reset error
         
         if os.path.exists(self.config_path):
+            # 先记录签名: 即使文件格式错误，在被再次修改前也不重复解析
+            self._file_sig = self._stat_sig()
             try:
                 with open(self.config_path, "r", encoding="utf-8") as f:
                     content = f.read().strip()
                     if not content:
                          # Handle empty file explicitly
                          raise json.JSONDecodeError("File is empty", "", 0)
-                    loaded = json.loads(content)
+                    loaded = _json_loads(content)
                     
                 print("✅ [Config] Loaded successfully.")
                 return self._merge_config(self.DEFAULT_CONFIG, loaded)
@@ -98,121 +150,259 @@ class Config:
                 err_msg = f"JSON format error: {e.msg} at line {e.lineno}"
                 print(f"❌ [Config] {err_msg}")
                 self.last_error = err_msg
-                return copy.deepcopy(self.DEFAULT_CONFIG)
+                return _clone_json(self.DEFAULT_CONFIG)
                 
             except Exception as e:
                 err_msg = f"Load failed: {str(e)}"
                 print(f"❌ [Config] {err_msg}")
                 self.last_error = err_msg
-                return copy.deepcopy(self.DEFAULT_CONFIG)
+                return _clone_json(self.DEFAULT_CONFIG)
         else:
             print("⚠️ [Config] File not found. Creating default.")
             # 保存默认配置
             self.save_config(self.DEFAULT_CONFIG)
-            return copy.deepcopy(self.DEFAULT_CONFIG)
+            return _clone_json(self.DEFAULT_CONFIG)
     
     def _merge_config(self, default: dict, loaded: dict) -> dict:
-        """递归合并配置"""
-        result = copy.deepcopy(default)
+        """递归合并配置 (默认配置只拷贝一次，之后原地合并)"""
+        result = _clone_json(default)
+        self._merge_into(result, loaded)
+        return result
+    
+    def _merge_into(self, result: dict, loaded: dict):
+        """把 loaded 原地合并进 result"""
         for key, value in loaded.items():
             if key in result and isinstance(result[key], dict) and isinstance(value, dict):
-                result[key] = self._merge_config(result[key], value)
+                self._merge_into(result[key], value)
             else:
                 result[key] = value
-        return result
     
-    def save_config(self, config: dict = None):
-        """保存配置到文件"""
-        print(f"💾 [Config] Saving to {self.config_path}...")
-        if config is not None:
-            self.config = config
+    def save_config(self, config: dict = None, sync: bool = True) -> bool:
+        """
+        保存配置到文件，返回是否成功 (失败时保留待写盘标记，后台线程会再次尝试)
         
-        try:
-            with open(self.config_path, "w", encoding="utf-8") as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=2)
-            print("✅ [Config] Saved.")
-        except Exception as e:
-            print(f"❌ [Config] Save failed: {e}")
+        Args:
+            config: 替换当前配置后再保存 (默认保存当前内存配置)
+            sync: 是否立即写入 (默认)；为 False 时只标记为待写入，由后台线程合并后写盘
+        """
+        with self._lock:
+            if config is not None:
+                self.config = config
+            self._snap = None
+            self._flat_cache.clear()
+            if not sync:
+                self._mark_dirty()
+                return True
+            
+            print(f"💾 [Config] Saving to {self.config_path}...")
+            try:
+                # 先完整序列化，一次写入临时文件后原子替换: 读取方 (含手动编辑检测) 不会看到写了一半的文件
+                data = _json_dumps_bytes(self.config)
+                tmp_path = f"{self.config_path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.config_path)
+            except Exception as e:
+                print(f"❌ [Config] Save failed: {e}")
+                return False
+            
+            # 写盘成功后才清除待写盘标记
+            self._dirty = False
+            self._file_sig = self._stat_sig()
+        print("✅ [Config] Saved.")
+        return True
     
     def get(self, *keys, default=None):
         """
-        获取配置值 (每次获取前尝试重新加载，确保文件修改生效)
+        获取配置值 (每次获取前检查文件是否被修改，确保文件修改生效)
         
         Args:
             keys: 配置路径，如 get("image_api", "base_url")
             default: 默认值
         """
-        # [NEW] 每次获取配置时重新加载，解决用户手动修改 config.json 不生效的问题
-        self.reload()
+        # [NEW] 每次获取配置时检查并重新加载，解决用户手动修改 config.json 不生效的问题
+        # [PERF] 仅在文件 mtime/size 变化时重新解析；解析结果按键路径缓存
+        self._reload_if_changed()
         
-        result = self.config
-        for key in keys:
-            if isinstance(result, dict) and key in result:
-                result = result[key]
-            else:
+        with self._lock:
+            result = self._flat_cache.get(keys, _MISSING)
+            if result is _NOT_FOUND:
                 return default
-        return result
+            if result is not _MISSING:
+                return result
+            
+            result = self.config
+            for key in keys:
+                if isinstance(result, dict) and key in result:
+                    result = result[key]
+                else:
+                    self._flat_cache[keys] = _NOT_FOUND
+                    return default
+            self._flat_cache[keys] = result
+            return result
+
+    def _stat_sig(self):
+        """配置文件签名 (mtime_ns, size)，文件不存在时为 None"""
+        try:
+            st = os.stat(self.config_path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
 
     def reload(self):
-        """强制从磁盘重新加载配置"""
-        self.config = self.load_config()
+        """强制从磁盘重新加载配置 (先写入尚未保存的延迟修改，避免丢失)"""
+        with self._lock:
+            self.flush()
+            self.config = self.load_config()
+            self._snap = None
+            self._flat_cache.clear()
     
-    def set(self, *keys, value):
+    def _reload_if_changed(self):
+        """仅在配置文件 (mtime_ns, size) 自上次加载/保存后变化时重新加载；有未写盘的修改时以内存为准"""
+        if self._dirty or self._stat_sig() == self._file_sig:
+            return
+        with self._lock:
+            if self._dirty or self._stat_sig() == self._file_sig:
+                return
+            self.config = self.load_config()
+            self._snap = None
+            self._flat_cache.clear()
+    
+    def set(self, *keys, value, save: bool = True, sync: bool = True):
         """
         设置配置值
         
         Args:
             keys: 配置路径
             value: 配置值
+            save: 是否写入文件 (批量修改时可设为 False，最后统一 save_config)
+            sync: 是否立即写入 (默认)；为 False 时只标记为待写入，由后台线程合并后写盘
         """
         if len(keys) == 0:
             return
         
-        result = self.config
-        for key in keys[:-1]:
-            if key not in result:
-                result[key] = {}
-            result = result[key]
-        
-        result[keys[-1]] = value
-        self.save_config()
-    
-    def update_image_api(self, base_url: str, api_key: str, model: str):
-        """更新图片 API 配置"""
-        self.config["image_api"] = {
-            "base_url": base_url,
-            "api_key": api_key,
-            "model": model
-        }
-        self.save_config()
-    
-    def update_audio_api(self, base_url: str, reference_audio_cn: str, reference_audio_en: str):
-        """更新音频 API 配置"""
-        self.config["audio_api"] = {
-            "base_url": base_url,
-            "reference_audio_cn": reference_audio_cn,
-            "reference_audio_en": reference_audio_en
-        }
-        self.save_config()
-    
-    def update_video_api(self, base_url: str, api_key: str, model: str):
-        """更新视频 API 配置"""
-        self.config["video_api"] = {
-            "base_url": base_url,
-            "api_key": api_key,
-            "model": model
-        }
-        self.save_config()
+        with self._lock:
+            result = self.config
+            for key in keys[:-1]:
+                if key not in result:
+                    result[key] = {}
+                result = result[key]
+            
+            result[keys[-1]] = value
+            self._snap = None
+            self._flat_cache.clear()
+            if save:
+                if not self.save_config(sync=sync):
+                    # 立即写入失败时交给后台线程重试，避免修改丢失
+                    self._mark_dirty()
+    
+    def _mark_dirty(self):
+        """标记有待写盘的修改，并确保后台写盘线程已启动 (调用方需持有 _lock)"""
+        self._dirty = True
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+            atexit.register(self.flush)
+    
+    def _flush_loop(self, interval: float = 2.0):
+        """后台线程: 每隔 interval 秒把累积的修改一次性写盘 (写盘失败时保留标记，下一轮重试)"""
+        while True:
+            time.sleep(interval)
+            self.flush()
+    
+    def flush(self) -> bool:
+        """立即写入尚未保存的修改，返回是否已无待写盘的修改"""
+        with self._lock:
+            if self._dirty:
+                return self.save_config()
+        return True
+    
+    def update_image_api(self, base_url: str, api_key: str, model: str, save: bool = True):
+        """更新图片 API 配置 (只更新这几个字段，保留用户额外添加的键)"""
+        with self._lock:
+            self.config.setdefault("image_api", {}).update({
+                "base_url": base_url,
+                "api_key": api_key,
+                "model": model
+            })
+            self._snap = None
+            self._flat_cache.clear()
+            if save:
+                self.save_config()
+    
+    def update_audio_api(self, base_url: str, reference_audio_cn: str, reference_audio_en: str,
+                         save: bool = True):
+        """更新音频 API 配置 (只更新这几个字段，保留用户额外添加的键)"""
+        with self._lock:
+            self.config.setdefault("audio_api", {}).update({
+                "base_url": base_url,
+                "reference_audio_cn": reference_audio_cn,
+                "reference_audio_en": reference_audio_en
+            })
+            self._snap = None
+            self._flat_cache.clear()
+            if save:
+                self.save_config()
+    
+    def update_video_api(self, base_url: str, api_key: str, model: str, save: bool = True):
+        """更新视频 API 配置 (只更新这几个字段，保留用户额外添加的键)"""
+        with self._lock:
+            self.config.setdefault("video_api", {}).update({
+                "base_url": base_url,
+                "api_key": api_key,
+                "model": model
+            })
+            self._snap = None
+            self._flat_cache.clear()
+            if save:
+                self.save_config()
     
     def to_dict(self) -> dict:
         """返回完整配置字典"""
-        # [FIX] 确保返回最新配置
-        self.reload()
-        return copy.deepcopy(self.config)
+        # [FIX] 确保返回最新配置 (文件未变化时不重新解析)
+        self._reload_if_changed()
+        with self._lock:
+            return _clone_json(self.config)
+    
+    def snapshot(self) -> dict:
+        """
+        返回当前配置的只读快照 (调用方不得修改)
+        与 to_dict 一样先检查文件是否被手动修改 (仅 stat)；快照在配置被重新加载或修改后才重建，避免每次请求都深拷贝
+        """
+        self._reload_if_changed()
+        with self._lock:
+            if self._snap is None or self._snap_src is not self.config:
+                self._snap = _clone_json(self.config)
+                self._snap_src = self.config
+            return self._snap
+
+
+_config_singleton = None
+_config_lock = threading.Lock()
+
+
+def get_config() -> Config:
+    """返回全局 Config 实例，首次调用时才读取配置文件"""
+    global _config_singleton
+    if _config_singleton is None:
+        with _config_lock:
+            if _config_singleton is None:
+                _config_singleton = Config()
+    return _config_singleton
+
+
+class _LazyConfig:
+    """全局配置代理: import 时不读取文件，首次访问属性时才创建 Config"""
+    
+    def __getattr__(self, name):
+        return getattr(get_config(), name)
+    
+    def __setattr__(self, name, value):
+        setattr(get_config(), name, value)
 
 
-# 全局配置实例
-config = Config()
+# 全局配置实例 (延迟加载)
+config = _LazyConfig()
 
 
 if __name__ == "__main__":
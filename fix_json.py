@@ -4,42 +4,44 @@
 """
 
 import re
+import json
+
+# 匹配 """...""" 模式（非贪婪）；按字节匹配，省去整个文件的 UTF-8 解码/编码
+# (UTF-8 多字节字符中不会出现 ASCII 的引号与换行字节，按字节替换是安全的)
+_TRIPLE_QUOTES_RE = re.compile(rb'"""(.*?)"""', re.DOTALL)
+
+
+def _replace_triple_quotes(match):
+    inner = match.group(1)
+    # 将实际换行符替换为 \\n 转义序列
+    inner = inner.replace(b'\r\n', b'\\n').replace(b'\n', b'\\n')
+    # 将内部的双引号转义
+    inner = inner.replace(b'"', b'\\"')
+    return b'"' + inner + b'"'
+
 
 def fix_json_file():
     input_path = "child_story.json"
     output_path = "child_story_fixed.json"
     
-    with open(input_path, "r", encoding="utf-8") as f:
+    with open(input_path, "rb") as f:
         content = f.read()
     
-    # 找到所有 """...""" 模式并替换
-    # 步骤1: 将三引号内的换行符替换为 \n 转义序列
-    def replace_triple_quotes(match):
-        inner = match.group(1)
-        # 将实际换行符替换为 \\n 转义序列
-        inner = inner.replace('\r\n', '\\n').replace('\n', '\\n')
-        # 将内部的双引号转义
-        inner = inner.replace('"', '\\"')
-        return '"' + inner + '"'
-    
-    # 匹配 """...""" 模式（非贪婪）
-    pattern = r'"""(.*?)"""'
-    fixed_content = re.sub(pattern, replace_triple_quotes, content, flags=re.DOTALL)
+    # 找到所有 """...""" 模式并替换: 三引号内的换行符转为 \n 转义序列，双引号转义
+    fixed_content = _TRIPLE_QUOTES_RE.sub(_replace_triple_quotes, content)
     
     # 写入修复后的文件
-    with open(output_path, "w", encoding="utf-8") as f:
+    with open(output_path, "wb") as f:
         f.write(fixed_content)
     
     print(f"修复完成！已保存到 {output_path}")
     
-    # 验证 JSON 是否有效
-    import json
+    # 验证 JSON 是否有效 (直接解析内存中的修复结果，不再从磁盘读回刚写入的文件)
     try:
-        with open(output_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = json.loads(fixed_content)
         print(f"✅ JSON 验证通过！共 {len(data.get('script', []))} 个场景")
         
-        # 覆盖原文件
+        # 覆盖原文件 (json.dump 内部按片段增量编码写入，不会先拼出完整字符串)
         with open(input_path, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         print(f"✅ 已更新原文件 {input_path}")
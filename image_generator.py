@@ -6,9 +6,25 @@
 
 import os
 import re
-import base64
+import binascii
 import requests
 import json
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+
+# [PERF] orjson 为可选依赖: 请求体 (含数 MB 的 base64 参考图) 直接序列化为 bytes，缺失时回退到标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from image_utils import REF_MAX_SIZE, REF_JPEG_QUALITY, jpeg_data_url, file_data_url, ensure_dir, open_for_write, remove_partial, run_concurrently
+
+
+# 响应中的图片: Markdown 括号内的 base64 data URL 或 http(s) URL，一次扫描
+_IMG_RE = re.compile(r'\((?:data:image/[^;]+;base64,(?P<b64>[^)]+)|(?P<url>https?://[^)]+))\)')
+_IMG_URL_RE = re.compile(r'\((?P<url>https?://[^)]+)\)')
+
 
 class ImageGenerator:
     """图片生成器类"""
@@ -25,11 +41,19 @@ class ImageGenerator:
         self.base_url = base_url.rstrip('/')
         self.model = "gemini-3-pro-preview-image"
         self.max_retries = 3  # [NEW] 默认重试次数
+        # [PERF] 复用连接池: 批量生成时省去每次请求的 DNS/TCP/TLS 握手 (重试由 generate_with_reference 负责)
+        self._session = requests.Session()
+        self._pool_maxsize = 8  # 同时也是 generate_batch 的并发上限
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self._pool_maxsize, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        # 多张参考图并行读取/缩放/编码 (文件读取与 PIL 解码、缩放、JPEG 编码期间释放 GIL)
+        self._io_pool = ThreadPoolExecutor(max_workers=4)
         # self.image_size 已移除，不再使用
         self._output_dir = os.path.join(os.path.dirname(__file__), "output")
         
         # 确保输出目录存在
-        os.makedirs(os.path.join(self._output_dir, "images"), exist_ok=True)
+        ensure_dir(os.path.join(self._output_dir, "images"))
 
     def update_config(self, api_key: str, base_url: str, model: str = None):
         """更新配置"""
@@ -47,32 +71,41 @@ class ImageGenerator:
     def output_dir(self, value):
         """设置输出目录并确保目录存在"""
         self._output_dir = value
-        os.makedirs(os.path.join(value, "images"), exist_ok=True)
+        ensure_dir(os.path.join(value, "images"))
     
-    def _encode_image(self, image_path: str) -> str:
+    def _encode_image(self, image_path: str, quality: int = REF_JPEG_QUALITY) -> str:
         """
-        读取图片并转为 Base64 字符串
+        读取图片，缩放到 REF_MAX_SIZE 以内并压缩为 JPEG，转为 Base64 data URL (结果按文件 mtime/大小 缓存)
         """
         if not os.path.exists(image_path):
             print(f"❌ 警告: 找不到文件 {image_path}")
             return None
         
         try:
-            with open(image_path, "rb") as f:
-                return base64.b64encode(f.read()).decode("utf-8")
+            return jpeg_data_url(image_path, REF_MAX_SIZE, quality)
+        except Exception as e:
+            # 无法解码时按原样上传
+            print(f"⚠️ 参考图压缩失败，使用原图 {image_path}: {e}")
+        try:
+            return file_data_url(image_path, "image/jpeg")
         except Exception as e:
             print(f"❌ 读取图片失败 {image_path}: {e}")
             return None
 
-    def _save_base64_image(self, base64_data: str, save_path: str) -> bool:
+    def _save_base64_image(self, base64_data: str | bytes, save_path: str) -> bool:
         """保存 Base64 图片"""
         try:
-            # 清理
-            base64_data = base64_data.strip().replace('\n', '')
-            img_bytes = base64.b64decode(base64_data)
-            with open(save_path, "wb") as f:
-                f.write(img_bytes)
-            print(f"✅ 图片已保存: {save_path} ({len(img_bytes)/1024:.1f}KB)")
+            # 已是 bytes (二进制读取的响应) 时不再编码；清理: 一次 translate 删除所有空白字符
+            if isinstance(base64_data, str):
+                base64_data = base64_data.encode("ascii")
+            encoded = base64_data.translate(None, b"\r\n\t ")
+            # 按 64 KiB (4 的倍数) 分块解码直接写入文件，不在内存中构造完整的图片 bytes
+            chunk = 64 * 1024
+            written = 0
+            with open_for_write(save_path) as f:
+                for start in range(0, len(encoded), chunk):
+                    written += f.write(binascii.a2b_base64(encoded[start:start + chunk]))
+            print(f"✅ 图片已保存: {save_path} ({written/1024:.1f}KB)")
             return True
         except Exception as e:
             print(f"❌ 保存图片出错: {e}")
@@ -81,17 +114,39 @@ class ImageGenerator:
     def _save_url_image(self, url: str, save_path: str) -> bool:
         """下载并保存 URL 图片"""
         try:
-            resp = requests.get(url, timeout=60)
-            if resp.status_code == 200:
-                with open(save_path, "wb") as f:
-                    f.write(resp.content)
-                print(f"✅ 图片已下载: {save_path}")
-                return True
-            return False
+            # 流式下载，分块写入临时文件，完成后再替换 (中途断开不会留下半张图片)
+            with self._session.get(url, timeout=60, stream=True) as resp:
+                if resp.status_code != 200:
+                    return False
+                tmp_path = save_path + ".part"
+                try:
+                    with open_for_write(tmp_path) as f:
+                        for chunk in resp.iter_content(chunk_size=65536):
+                            if chunk:
+                                f.write(chunk)
+                    os.replace(tmp_path, save_path)
+                except BaseException:
+                    remove_partial(tmp_path)  # 失败时不留下残缺的 .part 文件
+                    raise
+            print(f"✅ 图片已下载: {save_path}")
+            return True
         except Exception as e:
             print(f"❌ 下载图片出错: {e}")
             return False
             
+    def generate_batch(self, jobs, max_workers: int = 4) -> list:
+        """
+        [PERF] 并发生成多张互相独立的图片 (并发数不超过连接池大小)
+        
+        Args:
+            jobs: [(prompt, ref_images, filename), ...]
+            max_workers: 并发数
+            
+        Returns:
+            list: 与 jobs 顺序一致的结果 dict 列表
+        """
+        return run_concurrently(self.generate_with_reference, jobs, min(max_workers, self._pool_maxsize))
+
     def generate_text_to_image(self, prompt: str, filename: str) -> dict:
         """文生图包装器"""
         return self.generate_with_reference(prompt, [], filename)
@@ -139,13 +194,16 @@ class ImageGenerator:
         # 2. 添加参考图片 (如果有)
         valid_refs = 0
         if ref_images:
-            for img_path in ref_images:
-                b64_str = self._encode_image(img_path)
-                if b64_str:
+            if len(ref_images) > 1:
+                data_urls = list(self._io_pool.map(self._encode_image, ref_images))  # map 保持原顺序
+            else:
+                data_urls = [self._encode_image(ref_images[0])]
+            for data_url in data_urls:
+                if data_url:
                     content_list.append({
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{b64_str}"
+                            "url": data_url
                         }
                     })
                     valid_refs += 1
@@ -171,7 +229,12 @@ class ImageGenerator:
         }
 
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=120)
+            # 手动序列化一次后以 data= 发送 (内容全为 ASCII/UTF-8，Content-Type 已在 headers 中设置)
+            if orjson is not None:
+                body = orjson.dumps(payload)
+            else:
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            response = self._session.post(url, data=body, headers=headers, timeout=120)
             
             # 检查状态码
             if response.status_code != 200:
@@ -182,7 +245,7 @@ class ImageGenerator:
                 }
             
             # 解析响应
-            result = response.json()
+            result = orjson.loads(response.content) if orjson is not None else response.json()
             # print(f"API 响应: {result}") # 调试用
 
             choices = result.get('choices', [])
@@ -195,8 +258,8 @@ class ImageGenerator:
             # 格式通常是: ![image](data:image/png;base64,...)
             # 或者直接是 URL
             
-            # 1. 尝试匹配 Base64 Markdown
-            b64_match = re.search(r'\(data:image/[^;]+;base64,([^\)]+)\)', content)
+            # 1. 一次扫描同时匹配 Base64 / URL Markdown
+            img_match = _IMG_RE.search(content)
             
             # 确定保存路径
             if "images" in filename or filename.startswith("page_"):
@@ -204,15 +267,16 @@ class ImageGenerator:
             else:
                 save_path = os.path.join(self.output_dir, f"{filename}.png")
 
-            if b64_match:
-                base64_data = b64_match.group(1)
+            if img_match and img_match.group("b64"):
+                base64_data = img_match.group("b64")
                 if self._save_base64_image(base64_data, save_path):
                     return {"success": True, "path": save_path, "url": None, "error": None}
+                # base64 保存失败时继续查找其后的 URL
+                img_match = _IMG_URL_RE.search(content, img_match.end())
             
-            # 2. 尝试匹配 URL Markdown ![image](http...)
-            url_match = re.search(r'\((https?://[^\)]+)\)', content)
-            if url_match:
-                img_url = url_match.group(1)
+            # 2. URL Markdown ![image](http...)
+            if img_match and img_match.group("url"):
+                img_url = img_match.group("url")
                 if self._save_url_image(img_url, save_path):
                     return {"success": True, "path": save_path, "url": img_url, "error": None}
             
@@ -5,11 +5,26 @@
 
 import os
 import re
-import io
 import json
-import base64
 import requests
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# [PERF] orjson 为可选依赖: 请求体 (含 base64 参考图) 一次序列化为 bytes、SSE 帧解析，缺失时回退到标准库 json
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    orjson = None
+    _json_loads = json.loads  # 标准库 json.loads 同样接受 UTF-8 bytes
+
+from image_utils import REF_MAX_SIZE, REF_JPEG_QUALITY, jpeg_data_url, ensure_dir, open_for_write, remove_partial, run_concurrently
+
+# 响应中的 Markdown 图片 URL: ![...](http...)；用否定字符类代替惰性 .*?，避免逐字符回溯重试
+_MD_IMG_RE = re.compile(r"!\[[^\]]*\]\((https?://[^\s)]+)\)")
+# 跨 SSE 帧匹配时保留的上一段文本长度 (足以容纳带签名参数的长 URL)
+_TAIL_KEEP = 4096
+
 
 class ImageGeneratorFlow:
     """图片生成器 (Flow2API 版本)"""
@@ -21,9 +36,17 @@ class ImageGeneratorFlow:
         self.model = model
         self.max_retries = 3
         self._output_dir = os.path.join(os.path.dirname(__file__), "output")
+        # [PERF] 复用连接池：生成请求与图片下载共用 keep-alive 连接，免去每次 TCP/TLS 握手
+        self._session = requests.Session()
+        self._pool_maxsize = 16  # 同时也是 generate_batch 的并发上限
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self._pool_maxsize, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        # 多张参考图并行读取/缩放/编码
+        self._io_pool = ThreadPoolExecutor(max_workers=4)
         
         # 确保 output/images 存在
-        os.makedirs(os.path.join(self._output_dir, "images"), exist_ok=True)
+        ensure_dir(os.path.join(self._output_dir, "images"))
 
     def update_config(self, api_key: str, base_url: str, model: str = None):
         """更新配置"""
@@ -32,6 +55,11 @@ class ImageGeneratorFlow:
         if model:
             self.model = model
 
+    def close(self):
+        """关闭连接池与编码线程池"""
+        self._session.close()
+        self._io_pool.shutdown(wait=False)
+
     @property
     def output_dir(self):
         return self._output_dir
@@ -39,33 +67,25 @@ class ImageGeneratorFlow:
     @output_dir.setter
     def output_dir(self, value):
         self._output_dir = value
-        os.makedirs(os.path.join(value, "images"), exist_ok=True)
+        ensure_dir(os.path.join(value, "images"))
 
-    def _encode_image(self, image_path: str) -> str | None:
-        """本地图片 -> Base64 (兼容 jpg/png)"""
-        if not os.path.exists(image_path):
+    def _encode_image(self, image_path: str, quality: int = REF_JPEG_QUALITY) -> str | None:
+        """本地图片 -> Base64 data URL (兼容 jpg/png，RGB 转换并限制最大边长 1024；结果按文件 mtime/大小 缓存)"""
+        try:
+            return jpeg_data_url(image_path, REF_MAX_SIZE, quality)
+        except FileNotFoundError:
             print(f"❌ [Flow] 找不到图片: {image_path}")
             return None
-            
-        try:
-            # 简单压缩以防过大 (保持原逻辑，这里复用 V2 的 PIL 逻辑稍微处理一下，或者直接读取)
-            # 用户示例直接 read，我们这里做个简单的 RGB 转换防止 RGBA 报错，并限制大小
-            with Image.open(image_path) as img:
-                if img.mode in ("RGBA", "P"):
-                    img = img.convert("RGB")
-                    
-                # 限制最大边长 1024 (可选，根据实际需求)
-                if max(img.size) > 1024:
-                    img.thumbnail((1024, 1024), Image.Resampling.LANCZOS)
-                
-                buf = io.BytesIO()
-                img.save(buf, format="JPEG", quality=85)
-                buf.seek(0)
-                return base64.b64encode(buf.read()).decode("utf-8")
         except Exception as e:
             print(f"❌ [Flow] 图片处理失败: {e}")
             return None
 
+    def _encode_images_batch(self, paths: list) -> list:
+        """多张参考图并行编码 (解码/缩放/JPEG 编码期间释放 GIL)，返回与 paths 顺序一致的 data URL 列表"""
+        if len(paths) > 1:
+            return list(self._io_pool.map(self._encode_image, paths))  # map 保持原顺序
+        return [self._encode_image(p) for p in paths]
+
     def generate_text_to_image(self, prompt: str, filename: str) -> dict:
         return self.generate_with_reference(prompt, [], filename)
 
@@ -88,6 +108,19 @@ class ImageGeneratorFlow:
         
         return {"success": False, "error": f"重试 {self.max_retries} 次后仍失败: {last_error}"}
 
+    def generate_batch(self, jobs, max_workers: int = 4) -> list:
+        """
+        [PERF] 并发生成多张互相独立的图片 (并发数不超过连接池大小)
+        
+        Args:
+            jobs: [(prompt, ref_images, filename), ...]
+            max_workers: 并发数
+            
+        Returns:
+            list: 与 jobs 顺序一致的结果 dict 列表
+        """
+        return run_concurrently(self.generate_with_reference, jobs, min(max_workers, self._pool_maxsize))
+
     def _do_generate(self, prompt: str, ref_images: list, filename: str) -> dict:
         """
         基于 requests + stream=True 实现 Manual Parsing
@@ -109,13 +142,12 @@ class ImageGeneratorFlow:
         content_list.append({"type": "text", "text": prompt})
 
         valid_refs = 0
-        for p in ref_images:
-            b64 = self._encode_image(p)
-            if b64:
+        for data_url in self._encode_images_batch(ref_images):
+            if data_url:
                 content_list.append({
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{b64}"
+                        "url": data_url
                     }
                 })
                 valid_refs += 1
@@ -134,27 +166,34 @@ class ImageGeneratorFlow:
         }
 
         image_url = None
+        tail = ""  # 滚动缓冲: Markdown 链接可能被拆分在相邻的两个 SSE 帧中
         
         try:
-            with requests.post(url, headers=headers, json=payload, stream=True, timeout=120) as resp:
+            # 手动序列化一次后以 data= 发送 (Content-Type 已在 headers 中设置)，不再由 requests 内部 json.dumps 复制一份
+            if orjson is not None:
+                body = orjson.dumps(payload)
+            else:
+                body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            with self._session.post(url, headers=headers, data=body, stream=True, timeout=120) as resp:
                 if resp.status_code != 200:
                     return {"success": False, "error": f"API 状态码 {resp.status_code}: {resp.text[:200]}"}
 
                 print("⏳ [Flow] 接收流式响应...", end="", flush=True)
                 
-                for raw_line in resp.iter_lines(decode_unicode=True):
+                # 按 bytes 逐行处理，直接交给 JSON 解析器，省去每行先解码为 str
+                for raw_line in resp.iter_lines():
                     if not raw_line:
                         continue
                     
-                    if raw_line.startswith("data:"):
+                    if raw_line.startswith(b"data:"):
                         raw_line = raw_line[5:].strip()
                     
-                    if raw_line == "[DONE]":
+                    if raw_line == b"[DONE]":
                         break
                     
                     try:
-                        chunk = json.loads(raw_line)
-                    except json.JSONDecodeError:
+                        chunk = _json_loads(raw_line)
+                    except ValueError:  # json / orjson 的 JSONDecodeError 均为 ValueError 子类
                         continue
                     
                     delta = chunk.get("choices", [{}])[0].get("delta", {})
@@ -164,13 +203,13 @@ class ImageGeneratorFlow:
                         # 简单的进度反馈
                         print(".", end="", flush=True)
                         
-                        # 提取 Markdown 图片 URL: ![...](http...)
-                        match = re.search(r"!\[.*?\]\((https?://[^\s)]+)\)", content)
+                        # 提取 Markdown 图片 URL: ![...](http...)；正则要求右括号，匹配到即为完整 URL
+                        tail = tail[-_TAIL_KEEP:] + content
+                        match = _MD_IMG_RE.search(tail)
                         if match:
                             image_url = match.group(1)
-                            # 找到 URL 后是否可以 break？
-                            # 通常是一次返回完整 Markdown 链接，但也可能分片
-                            # 安全起见，继续读完或直到找到完整 URL
+                            # [PERF] 立即关闭连接，不再等待服务端的后续文本
+                            resp.close()
                             break
                             
             print(" 完成")
@@ -180,27 +219,35 @@ class ImageGeneratorFlow:
             
             # 下载生成图片
             print(f"⬇️ [Flow] 下载图片: {image_url[:60]}...")
-            img_resp = requests.get(image_url, timeout=60)
-            if img_resp.status_code == 200:
+            # 流式下载，分块写入临时文件，完成后再替换 (不在内存中缓存整张图片，中途断开不会留下半张图片)
+            with self._session.get(image_url, timeout=60, stream=True) as img_resp:
+                if img_resp.status_code != 200:
+                    return {"success": False, "error": f"下载图片失败: {img_resp.status_code}"}
+                
                 # 确定保存路径
                 if "images" in filename or filename.startswith("page_"):
                     save_path = os.path.join(self.output_dir, "images", f"{filename}.png")
                 else:
                     save_path = os.path.join(self.output_dir, f"{filename}.png")
                 
-                os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                with open(save_path, "wb") as f:
-                    f.write(img_resp.content)
-                
-                print(f"✅ [Flow] 图片已保存: {save_path}")
-                return {
-                    "success": True, 
-                    "path": save_path, 
-                    "url": image_url, 
-                    "error": None
-                }
-            else:
-                return {"success": False, "error": f"下载图片失败: {img_resp.status_code}"}
+                tmp_path = save_path + ".part"
+                try:
+                    with open_for_write(tmp_path) as f:
+                        for chunk in img_resp.iter_content(chunk_size=65536):
+                            if chunk:
+                                f.write(chunk)
+                    os.replace(tmp_path, save_path)
+                except BaseException:
+                    remove_partial(tmp_path)  # 失败时不留下残缺的 .part 文件
+                    raise
+            
+            print(f"✅ [Flow] 图片已保存: {save_path}")
+            return {
+                "success": True, 
+                "path": save_path, 
+                "url": image_url, 
+                "error": None
+            }
 
         except Exception as e:
             print(f"\n❌ [Flow] 请求异常: {e}")
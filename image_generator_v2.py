@@ -8,12 +8,23 @@
 
 import os
 import re
-import io
-import base64
+import binascii
 import requests
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from openai import OpenAI
 
+# 响应中的图片: base64 data URL / 带图片扩展名的 http(s) URL (模块级预编译)
+# base64 主体不含 '='，填充只允许出现在末尾，避免在长 blob 上回溯
+_B64_RE = re.compile(r'data:image/([^;]+);base64,([A-Za-z0-9+/]+=*)')
+_URL_RE = re.compile(r'(https?://[^\s\)\]\"]+)')
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+# 可终止 base64 / URL 的字符: 新片段中出现它们时才需要重新检查是否已拿到完整图片
+_TERM_RE = re.compile(r'[^A-Za-z0-9+/=]')
+# 图片 base64 / URL 可能的起点: 已扫描过的文本只需从最后一个起点开始保留
+_START_RE = re.compile(r'data:image/|https?://')
+
+from image_utils import REF_MAX_SIZE, REF_JPEG_QUALITY, jpeg_data_url, ensure_dir, open_for_write, remove_partial, run_concurrently
 
 class ImageGeneratorV2:
     """图片生成器 V2 - 流式响应版本"""
@@ -35,30 +46,45 @@ class ImageGeneratorV2:
         self.image_size = image_size
         self.max_retries = 3
         self._output_dir = os.path.join(os.path.dirname(__file__), "output")
-        self.client = None
-        self._init_client()
+        self.client = None  # OpenAI 客户端，首次使用时创建 (见 _get_client)
+        # [PERF] 图片下载复用连接池 (keep-alive)，免去每次 TCP/TLS 握手
+        self._session = requests.Session()
+        self._pool_maxsize = 16  # 同时也是 generate_batch 的并发上限
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self._pool_maxsize, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        # 多张参考图并行读取/缩放/编码
+        self._io_pool = ThreadPoolExecutor(max_workers=4)
         
         # 确保输出目录存在
-        os.makedirs(os.path.join(self._output_dir, "images"), exist_ok=True)
+        ensure_dir(os.path.join(self._output_dir, "images"))
     
-    def _init_client(self):
-        """初始化 OpenAI 客户端"""
-        if self.api_key and self.base_url:
+    def _get_client(self):
+        """获取 OpenAI 客户端 (延迟创建，未配置时返回 None)"""
+        if not self.client and self.api_key and self.base_url:
             # 确保 base_url 包含 /v1
             base = self.base_url
             if not base.endswith('/v1'):
                 base += '/v1'
             self.client = OpenAI(api_key=self.api_key, base_url=base)
+        return self.client
     
     def update_config(self, api_key: str, base_url: str, model: str = None, image_size: str = None):
-        """更新配置"""
+        """更新配置 (仅在连接参数变化时重建客户端)"""
+        base_url = base_url.rstrip('/')
+        if api_key != self.api_key or base_url != self.base_url:
+            self.client = None # Reset client
         self.api_key = api_key
-        self.base_url = base_url.rstrip('/')
+        self.base_url = base_url
         if model:
             self.model = model
         if image_size is not None:
             self.image_size = image_size
-        self._init_client()
+    
+    def close(self):
+        """关闭连接池与编码线程池"""
+        self._session.close()
+        self._io_pool.shutdown(wait=False)
     
     @property
     def output_dir(self):
@@ -69,48 +95,51 @@ class ImageGeneratorV2:
     def output_dir(self, value):
         """设置输出目录并确保目录存在"""
         self._output_dir = value
-        os.makedirs(os.path.join(value, "images"), exist_ok=True)
-    
-    def _encode_image(self, image_path: str, max_size: int = 1024) -> str | None:
-        """本地图片 → Base64（自动缩放 / 压缩）"""
-        if not os.path.exists(image_path):
-            print(f"❌ 找不到图片: {image_path}")
-            return None
+        ensure_dir(os.path.join(value, "images"))
 
+    def _encode_image(self, image_path: str, max_size: int = REF_MAX_SIZE,
+                      quality: int = REF_JPEG_QUALITY) -> str | None:
+        """本地图片 → Base64 data URL（自动缩放 / 压缩，结果按文件 mtime/大小 缓存）"""
         try:
-            with Image.open(image_path) as img:
-                if img.mode in ("RGBA", "P"):
-                    img = img.convert("RGB")
-
-                if max(img.size) > max_size:
-                    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-
-                buf = io.BytesIO()
-                img.save(buf, format="JPEG", quality=85)
-                buf.seek(0)
-
-                return base64.b64encode(buf.read()).decode("utf-8")
-
+            return jpeg_data_url(image_path, max_size, quality)
+        except FileNotFoundError:
+            print(f"❌ 找不到图片: {image_path}")
+            return None
         except Exception as e:
             print(f"❌ 图片处理失败: {e}")
             return None
 
-    def _extract_image_from_content(self, content: str):
+    def _encode_images_batch(self, paths: list) -> list:
+        """多张参考图并行编码 (解码/缩放/JPEG 编码期间释放 GIL)，返回与 paths 顺序一致的 data URL 列表"""
+        if len(paths) > 1:
+            return list(self._io_pool.map(self._encode_image, paths))  # map 保持原顺序
+        return [self._encode_image(p) for p in paths]
+
+    def _extract_image_from_content(self, content: str, complete_only: bool = False):
         """
         从模型返回文本中提取图片
+        complete_only: 流式接收途中使用，只接受后面已跟有其他字符的匹配 (base64/URL 已完整到达)
         返回:
             ("base64", data, format) | ("url", url, None) | (None, None, None)
         """
+        # 快速排除: 纯文本回复 (无 data URL、无链接) 不必运行正则
+        if "data:image/" not in content and "://" not in content:
+            return None, None, None
+
+        end = len(content)
         # Base64
-        base64_pattern = r'data:image/([^;]+);base64,([A-Za-z0-9+/=]+)'
-        m = re.search(base64_pattern, content)
+        m = _B64_RE.search(content)
         if m:
+            if complete_only and m.end() >= end:
+                return None, None, None
             return "base64", m.group(2), m.group(1)
 
         # URL
-        urls = re.findall(r'(https?://[^\s\)\]\"]+)', content)
-        for url in urls:
-            if any(ext in url.lower() for ext in (".png", ".jpg", ".jpeg", ".webp")):
+        for m in _URL_RE.finditer(content):
+            url = m.group(1)
+            if any(ext in url.lower() for ext in IMAGE_EXTS):
+                if complete_only and m.end() >= end:
+                    return None, None, None
                 return "url", url, None
 
         return None, None, None
@@ -118,11 +147,14 @@ class ImageGeneratorV2:
     def _save_base64_image(self, base64_data: str, save_path: str) -> bool:
         """保存 Base64 图片"""
         try:
-            img_bytes = base64.b64decode(base64_data)
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            with open(save_path, "wb") as f:
-                f.write(img_bytes)
-            print(f"✅ 已保存图片: {save_path} ({len(img_bytes)/1024:.1f}KB)")
+            # 按 64 KiB (4 的倍数) 分块解码直接写入文件，不在内存中构造完整的图片 bytes
+            # (_B64_RE 匹配结果只含 ASCII base64 字符，a2b_base64 可直接接受 str 切片)
+            chunk = 64 * 1024
+            written = 0
+            with open_for_write(save_path) as f:
+                for start in range(0, len(base64_data), chunk):
+                    written += f.write(binascii.a2b_base64(base64_data[start:start + chunk]))
+            print(f"✅ 已保存图片: {save_path} ({written/1024:.1f}KB)")
             return True
         except Exception as e:
             print(f"❌ Base64 保存失败: {e}")
@@ -132,15 +164,23 @@ class ImageGeneratorV2:
         """下载图片"""
         try:
             print(f"⬇️ 下载图片: {url[:80]}...")
-            r = requests.get(url, timeout=120)
-            if r.status_code == 200:
-                os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                with open(save_path, "wb") as f:
-                    f.write(r.content)
-                print(f"✅ 已保存图片: {save_path}")
-                return True
-            print(f"❌ 下载失败，状态码: {r.status_code}")
-            return False
+            # 流式下载，分块写入临时文件，完成后再替换 (不在内存中缓存整张图片，中途断开不会留下半张图片)
+            with self._session.get(url, timeout=120, stream=True) as r:
+                if r.status_code != 200:
+                    print(f"❌ 下载失败，状态码: {r.status_code}")
+                    return False
+                tmp_path = save_path + ".part"
+                try:
+                    with open_for_write(tmp_path) as f:
+                        for chunk in r.iter_content(chunk_size=65536):
+                            if chunk:
+                                f.write(chunk)
+                    os.replace(tmp_path, save_path)
+                except BaseException:
+                    remove_partial(tmp_path)  # 失败时不留下残缺的 .part 文件
+                    raise
+            print(f"✅ 已保存图片: {save_path}")
+            return True
         except Exception as e:
             print(f"❌ 下载异常: {e}")
             return False
@@ -168,9 +208,23 @@ class ImageGeneratorV2:
         
         return {"success": False, "error": f"重试 {self.max_retries} 次后仍失败: {last_error}"}
 
+    def generate_batch(self, jobs, max_workers: int = 4) -> list:
+        """
+        [PERF] 并发生成多张互相独立的图片 (并发数不超过连接池大小)
+        
+        Args:
+            jobs: [(prompt, ref_images, filename), ...]
+            max_workers: 并发数
+            
+        Returns:
+            list: 与 jobs 顺序一致的结果 dict 列表
+        """
+        return run_concurrently(self.generate_with_reference, jobs, min(max_workers, self._pool_maxsize))
+
     def _do_generate(self, prompt: str, ref_images: list, filename: str) -> dict:
         """实际执行生成的内部方法 - 流式响应"""
-        if not self.client:
+        client = self._get_client()
+        if not client:
             return {"success": False, "error": "API 客户端未初始化，请检查配置"}
         
         # 构造消息内容
@@ -178,13 +232,12 @@ class ImageGeneratorV2:
         
         # 添加参考图片
         valid_refs = 0
-        for img_path in ref_images:
-            b64 = self._encode_image(img_path)
-            if b64:
+        for data_url in self._encode_images_batch(ref_images):
+            if data_url:
                 content.append({
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{b64}"
+                        "url": data_url
                     }
                 })
                 valid_refs += 1
@@ -207,15 +260,33 @@ class ImageGeneratorV2:
             params["extra_body"] = {"size": self.image_size}
         
         try:
-            stream = self.client.chat.completions.create(**params)
+            stream = client.chat.completions.create(**params)
             
-            full_content = ""
+            # [PERF] 边接收边解析: 拿到完整的图片 base64/URL 后立即关闭连接，不再等待服务端的后续文本
+            parts = []
+            pending = []  # 待扫描文本: 只含最后一个可能的图片起点之后的内容，每个字符只被扫描常数次
+            found = None
             print("⏳ 生成中...", end="", flush=True)
             for chunk in stream:
                 if chunk.choices and chunk.choices[0].delta.content:
                     print(".", end="", flush=True)
-                    full_content += chunk.choices[0].delta.content
+                    delta = chunk.choices[0].delta.content
+                    parts.append(delta)
+                    pending.append(delta)
+                    # base64 / URL 传输途中的片段不含终止字符，无需重复拼接和扫描
+                    if _TERM_RE.search(delta):
+                        text = "".join(pending)
+                        found = self._extract_image_from_content(text, complete_only=True)
+                        if found[0]:
+                            stream.response.close()
+                            break
+                        # 起点之前的文本已确认不含图片，丢弃；无起点时保留末尾几个字符以衔接被拆分的前缀
+                        last = None
+                        for last in _START_RE.finditer(text):
+                            pass
+                        pending = [text[last.start():] if last else text[-16:]]
             print(" 完成")
+            full_content = "".join(parts)
             
             # 确定保存路径
             if "images" in filename or filename.startswith("page_"):
@@ -224,7 +295,10 @@ class ImageGeneratorV2:
                 save_path = os.path.join(self.output_dir, f"{filename}.png")
             
             # 提取图片
-            result_type, data, _ = self._extract_image_from_content(full_content)
+            if found and found[0]:
+                result_type, data, _ = found
+            else:
+                result_type, data, _ = self._extract_image_from_content(full_content)
             
             if result_type == "base64":
                 success = self._save_base64_image(data, save_path)
@@ -0,0 +1,138 @@
+"""
+图片生成模块共用的工具函数
+- 参考图缩放 / JPEG 压缩 / Base64 data URL (按文件 mtime/大小 缓存)
+- 输出目录创建与写文件
+- 互相独立的生成任务并发执行
+"""
+
+import os
+import io
+import base64
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# [PERF] OpenCV 为可选依赖: 直接调用 libjpeg-turbo 缩放/编码参考图，缺失时回退到 Pillow
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+
+
+# 参考图最大边长: 仅用于保持角色/场景一致性，无需原始分辨率
+REF_MAX_SIZE = 1024
+# 参考图 JPEG 质量: 缩放后 q75 与 q85 肉眼难辨，base64 载荷约小 30%
+REF_JPEG_QUALITY = 75
+
+
+def _encode_jpeg_cv2(path: str, max_size: int, quality: int) -> bytes | None:
+    """用 OpenCV 读取图片，缩放到 max_size 以内并编码为 JPEG；失败返回 None"""
+    # np.fromfile + imdecode: 兼容 Windows 下的中文路径 (cv2.imread 不支持)
+    raw = np.fromfile(path, dtype=np.uint8)
+    flag = cv2.IMREAD_COLOR
+    if raw[:2].tobytes() == b"\xff\xd8":
+        # JPEG: 让 libjpeg-turbo 在 IDCT 阶段直接按 1/2、1/4、1/8 缩小解码，省去全分辨率解码
+        with Image.open(path) as probe:  # 只读取文件头
+            longest = max(probe.size)
+        for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                                (4, cv2.IMREAD_REDUCED_COLOR_4),
+                                (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if longest // factor >= max_size:
+                flag = reduced
+                break
+    img = cv2.imdecode(raw, flag)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    if max(h, w) > max_size:
+        scale = max_size / max(h, w)
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))),
+                         interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes() if ok else None
+
+
+def encode_jpeg(path: str, max_size: int = REF_MAX_SIZE, quality: int = REF_JPEG_QUALITY) -> bytes:
+    """读取图片，缩放到 max_size 以内并编码为 JPEG 字节 (优先 OpenCV，否则 Pillow)；无法解码时抛出异常"""
+    data = _encode_jpeg_cv2(path, max_size, quality) if cv2 is not None else None
+    if data is not None:
+        return data
+    with Image.open(path) as img:
+        img.draft("RGB", (max_size, max_size))  # JPEG 按 1/2~1/8 缩小解码 (不小于目标尺寸)；对其他格式无效果
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        if max(img.size) > max_size:
+            img.thumbnail((max_size, max_size), Image.Resampling.BILINEAR)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=False, progressive=False, subsampling=2)
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=32)
+def _jpeg_data_url_cached(path: str, mtime_ns: int, size: int, max_size: int, quality: int) -> str:
+    """
+    [PERF] 参考图 → JPEG Base64 data URL (按 路径+mtime+大小+max_size+质量 缓存)
+    设计稿在每页生成和每次重试时重复使用，只做一次解码/缩放/编码；文件被重新生成后缓存自然失效
+    """
+    return "data:image/jpeg;base64," + base64.b64encode(encode_jpeg(path, max_size, quality)).decode("ascii")
+
+
+def jpeg_data_url(path: str, max_size: int = REF_MAX_SIZE, quality: int = REF_JPEG_QUALITY) -> str:
+    """参考图 → 缩放压缩后的 JPEG data URL；文件不存在或无法解码时抛出异常"""
+    st = os.stat(path)
+    return _jpeg_data_url_cached(os.path.abspath(path), st.st_mtime_ns, st.st_size, max_size, quality)
+
+
+@lru_cache(maxsize=8)
+def _file_data_url_cached(path: str, mtime_ns: int, size: int, mime: str) -> str:
+    with open(path, "rb") as f:
+        return f"data:{mime};base64," + base64.b64encode(f.read()).decode("ascii")
+
+
+def file_data_url(path: str, mime: str = "image/png") -> str:
+    """原样读取文件转为 Base64 data URL (不缩放，按 路径+mtime+大小 缓存，重试时不重复读取和编码)"""
+    st = os.stat(path)
+    return _file_data_url_cached(os.path.abspath(path), st.st_mtime_ns, st.st_size, mime)
+
+
+_ensured_dirs = set()  # 本进程内已确认存在的目录
+
+
+def ensure_dir(path: str):
+    """创建目录；同一目录每个进程只调用一次 makedirs"""
+    if path not in _ensured_dirs:
+        os.makedirs(path, exist_ok=True)
+        _ensured_dirs.add(path)
+
+
+def open_for_write(save_path: str):
+    """以 wb 打开输出文件；目录在运行中被删除 (如删除项目) 时重新创建后再打开"""
+    try:
+        return open(save_path, "wb")
+    except FileNotFoundError:
+        parent = os.path.dirname(save_path)
+        _ensured_dirs.discard(parent)
+        ensure_dir(parent)
+        return open(save_path, "wb")
+
+
+def remove_partial(path: str):
+    """删除写入/下载失败后残留的临时文件 (不存在时忽略)"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def run_concurrently(func, jobs, max_workers: int) -> list:
+    """
+    [PERF] 以最多 max_workers 个线程并发执行 func(*job)，结果与 jobs 顺序一致
+    生成请求耗时几乎全在等待服务端，互相独立的任务并发后总耗时约为单个任务的耗时；只有一个任务时直接在当前线程执行
+    """
+    jobs = list(jobs)
+    workers = max(1, min(max_workers, len(jobs)))
+    if workers == 1:
+        return [func(*job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda job: func(*job), jobs))
@@ -28,8 +28,16 @@ PROMPT = '''Reference the character and scene from the image generated above, ma
 OUTPUT_DIR = "generated_images"
 # ===========================================
 
-from PIL import Image
-import io
+import re
+from image_utils import encode_jpeg
+
+# 响应中的图片链接 / base64 data URL (模块级预编译)
+_URL_RE = re.compile(r'(https?://[^\s\)]+)')
+_DATA_URL_RE = re.compile(r'\((data:image/[^;]+;base64,[^\)]+)\)')
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# [PERF] 模块级复用 Session (keep-alive 连接池)
+_session = requests.Session()
 
 def encode_image(image_path):
     """将本地图片转换为 Base64 字符串，并进行预处理（缩放、压缩）"""
@@ -38,26 +46,10 @@ def encode_image(image_path):
         return None
     
     try:
-        # 使用 Pillow 打开图片
-        with Image.open(image_path) as img:
-            # 转换为 RGB (兼容 PNG 透明通道)
-            if img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-                
-            # 缩放图片 (最大边长 1024)
-            max_size = 1024
-            if max(img.size) > max_size:
-                img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                
-            # 保存为 JPEG 格式到内存
-            buffer = io.BytesIO()
-            img.save(buffer, format="JPEG", quality=85)
-            buffer.seek(0)
-            
-            # 返回 Base64
-            encoded = base64.b64encode(buffer.read()).decode("utf-8")
-            print(f"🖼️ 已处理图片: {os.path.basename(image_path)} | 大小: {len(encoded)/1024:.1f}KB")
-            return encoded
+        # 缩放到 1024 以内并压缩为 JPEG (与生成模块共用 image_utils)
+        encoded = base64.b64encode(encode_jpeg(image_path)).decode("utf-8")
+        print(f"🖼️ 已处理图片: {os.path.basename(image_path)} | 大小: {len(encoded)/1024:.1f}KB")
+        return encoded
             
     except Exception as e:
         print(f"❌ 处理图片时出错 {image_path}: {e}")
@@ -74,13 +66,16 @@ def save_image_from_url(url, output_dir):
     
     try:
         print(f"⬇️ 正在下载图片: {url}")
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(filepath, "wb") as f:
-                f.write(response.content)
-            print(f"✅ 图片已保存至: {filepath}")
-        else:
-            print(f"❌ 下载失败，状态码: {response.status_code}")
+        # 流式下载，分块写入文件，不在内存中缓存整张图片
+        with _session.get(url, stream=True) as response:
+            if response.status_code == 200:
+                with open(filepath, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        if chunk:
+                            f.write(chunk)
+                print(f"✅ 图片已保存至: {filepath}")
+            else:
+                print(f"❌ 下载失败，状态码: {response.status_code}")
     except Exception as e:
         print(f"❌ 保存图片时出错: {e}")
 
@@ -133,11 +128,12 @@ def main():
         )
 
         print("\n⏳ 正在接收流式响应...")
-        content = ""
+        parts = []
         for chunk in stream:
             if chunk.choices[0].delta.content:
                 print(".", end="", flush=True)
-                content += chunk.choices[0].delta.content
+                parts.append(chunk.choices[0].delta.content)
+        content = "".join(parts)
         print("\n")
 
         # 3. 处理响应
@@ -145,21 +141,18 @@ def main():
         print(content)
         
         # 4. 尝试提取和保存图片
-        import re
-        urls = re.findall(r'(https?://[^\s\)]+)', content)
-        data_urls = re.findall(r'\((data:image/[^;]+;base64,[^\)]+)\)', content)
-        
-        clean_urls = [u.rstrip(')') for u in urls]
+        # 只需第一张图片: finditer 命中即停止扫描；找不到图片链接时才匹配 base64
+        url = next((m.group(1) for m in _URL_RE.finditer(content)
+                    if any(ext in m.group(1).lower() for ext in IMAGE_EXTS)), None)
         
         found_any = False
-        if clean_urls:
-            found_any = True
-            for url in clean_urls:
-                save_image_from_url(url, OUTPUT_DIR)
-        
-        if data_urls:
+        if url:
             found_any = True
-            for i, data_url in enumerate(data_urls):
+            save_image_from_url(url, OUTPUT_DIR)
+        else:
+            for i, m in enumerate(_DATA_URL_RE.finditer(content)):
+                found_any = True
+                data_url = m.group(1)
                 try:
                     header, encoded = data_url.split(',', 1)
                     ext = header.split(';')[0].split('/')[-1]
@@ -14,13 +14,28 @@ except ImportError:
     subprocess.run(["pip", "install", "scenedetect[opencv]"], check=True)
     from scenedetect import open_video, SceneManager, ContentDetector
 
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
 # 测试配置
 VIDEO_DIR = r"D:\gemini\child_story\output\完美的礼物\videos"
 OUTPUT_DIR = r"D:\gemini\child_story\output\完美的礼物"
 THRESHOLD = 27.0
 
 def get_duration(file_path):
-    """获取视频时长"""
+    """获取视频时长 (优先在进程内读取容器元数据，失败时再调用 ffprobe)"""
+    if cv2 is not None:
+        cap = cv2.VideoCapture(str(file_path))
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        finally:
+            cap.release()
+        if fps > 0 and frames > 0:
+            return frames / fps
+    
     cmd = [
         "ffprobe", "-v", "error",
         "-show_entries", "format=duration",
@@ -33,74 +48,143 @@ def get_duration(file_path):
     except:
         return None
 
+def _analyze_cv2(video_path, threshold=27.0, min_scene_len=15):
+    """
+    OpenCV 逐帧检测场景: 每帧缩小到 64x64 转 HSV，与上一帧的平均绝对差超过阈值即为切点
+    (与 ContentDetector 默认权重的指标相同，阈值可通用；逐像素计算全部在 OpenCV/NumPy 中完成)
+    同一次解码顺带得到时长，返回 (场景列表, 时长秒)
+    """
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not cap.isOpened() or not fps:
+            raise IOError(f"无法打开视频: {video_path}")
+        cuts = []
+        prev = None
+        frame_num = 0
+        last_cut = 0
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            small = cv2.cvtColor(cv2.resize(frame, (64, 64), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2HSV)
+            if (prev is not None and frame_num - last_cut >= min_scene_len
+                    and cv2.absdiff(small, prev).mean() > threshold):
+                cuts.append(frame_num)
+                last_cut = frame_num
+            prev = small
+            frame_num += 1
+    finally:
+        cap.release()
+    
+    duration = frame_num / fps
+    if not cuts:
+        return [], duration
+    bounds = [0] + cuts + [frame_num]
+    return [(start / fps, end / fps) for start, end in zip(bounds, bounds[1:])], duration
+
+def analyze_video(video_path, threshold=27.0):
+    """打开一次视频，同时得到场景列表与时长: ([(开始秒, 结束秒), ...], 时长秒)"""
+    if cv2 is not None:
+        try:
+            return _analyze_cv2(video_path, threshold)
+        except Exception as e:
+            print(f"OpenCV 场景检测失败，改用 scenedetect: {e}")
+    return _find_scenes_scenedetect(video_path, threshold), get_duration(video_path)
+
 def find_scenes(video_path, threshold=27.0):
-    """检测视频中的场景分割点"""
+    """检测视频中的场景分割点，返回 [(开始秒, 结束秒), ...]"""
+    return analyze_video(video_path, threshold)[0]
+
+def _find_scenes_scenedetect(video_path, threshold=27.0):
+    """scenedetect 场景检测 (OpenCV 不可用时的回退)"""
     try:
         video = open_video(str(video_path))
         scene_manager = SceneManager()
         scene_manager.add_detector(ContentDetector(threshold=threshold, min_scene_len=15))
         scene_manager.detect_scenes(video, show_progress=False)
-        return scene_manager.get_scene_list()
+        return [(start.get_seconds(), end.get_seconds()) for start, end in scene_manager.get_scene_list()]
     except Exception as e:
         print(f"场景检测失败: {e}")
         return []
 
-def trim_first_scene(input_path, output_path, threshold=27.0):
-    """删除视频的第一个场景 - 使用 -c copy (原始方式)"""
-    scenes = find_scenes(input_path, threshold)
+def first_scene_end(input_path, threshold=27.0):
+    """返回需要剪掉的第一个场景的结束时间 (秒)；无需剪辑 (无场景 / 首个镜头贯穿全片) 时返回 None"""
+    scenes, video_duration = analyze_video(input_path, threshold)
     
     if not scenes:
-        print(f"  未检测到场景，复制原视频")
-        shutil.copy2(input_path, output_path)
-        return True
+        print(f"  未检测到场景，使用原视频")
+        return None
     
-    first_scene_end = scenes[0][1].get_seconds()
-    video_duration = get_duration(input_path)
+    scene_end = scenes[0][1]
     
-    print(f"  首个镜头结束于: {first_scene_end:.2f}s / 总时长: {video_duration:.2f}s")
+    print(f"  首个镜头结束于: {scene_end:.2f}s / 总时长: {video_duration:.2f}s")
     
-    if first_scene_end >= video_duration:
-        print(f"  第一个镜头贯穿全片，复制原视频")
+    if scene_end >= video_duration:
+        print(f"  第一个镜头贯穿全片，使用原视频")
+        return None
+    return scene_end
+
+def trim_first_scene(input_path, output_path, threshold=27.0):
+    """删除视频的第一个场景 - 使用 -c copy (原始方式)"""
+    scene_end = first_scene_end(input_path, threshold)
+    if scene_end is None:
         shutil.copy2(input_path, output_path)
         return True
     
     # 使用 -c copy 剪辑 (这可能是问题所在)
+    # [PERF] -ss 放在 -i 前面: 利用容器索引快速定位，不必从头读到剪辑点 (流复制时落在最近的关键帧)
     cmd = [
         "ffmpeg", "-y",
+        "-ss", str(scene_end),
         "-i", str(input_path),
-        "-ss", str(first_scene_end),
         "-c", "copy",
+        "-avoid_negative_ts", "make_zero",
         str(output_path)
     ]
     result = subprocess.run(cmd, capture_output=True)
     return result.returncode == 0
 
-def trim_first_scene_reencode(input_path, output_path, threshold=27.0):
-    """删除视频的第一个场景 - 使用重新编码 (修复方式)"""
-    scenes = find_scenes(input_path, threshold)
-    
-    if not scenes:
-        print(f"  未检测到场景，复制原视频")
-        shutil.copy2(input_path, output_path)
-        return True
-    
-    first_scene_end = scenes[0][1].get_seconds()
-    video_duration = get_duration(input_path)
-    
-    print(f"  首个镜头结束于: {first_scene_end:.2f}s / 总时长: {video_duration:.2f}s")
-    
-    if first_scene_end >= video_duration:
-        print(f"  第一个镜头贯穿全片，复制原视频")
-        shutil.copy2(input_path, output_path)
-        return True
-    
-    # 使用重新编码剪辑 (确保关键帧对齐)
+def has_audio(file_path):
+    """检查视频是否包含音轨"""
     cmd = [
-        "ffmpeg", "-y",
-        "-ss", str(first_scene_end),  # 放在 -i 前面，更快
-        "-i", str(input_path),
+        "ffprobe", "-v", "error",
+        "-select_streams", "a",
+        "-show_entries", "stream=index",
+        "-of", "csv=p=0",
+        str(file_path)
+    ]
+    try:
+        return bool(subprocess.check_output(cmd, stderr=subprocess.DEVNULL).strip())
+    except:
+        return False
+
+def trim_and_concat_reencode(input_paths, output_path, threshold=27.0):
+    """
+    删除每个视频的第一个场景并拼接 - 一次 ffmpeg 调用完成 (修复方式)
+    每个输入用 -ss 定位到剪辑点 (输入端定位，转码时精确)，再用 concat 滤镜拼接，只解码/编码一遍
+    """
+    cmd = ["ffmpeg", "-y"]
+    for path in input_paths:
+        print(f"处理 {os.path.basename(path)}:")
+        scene_end = first_scene_end(path, threshold)
+        if scene_end is not None:
+            cmd += ["-ss", str(scene_end)]
+        cmd += ["-i", str(path)]
+    
+    n = len(input_paths)
+    audio = all(has_audio(path) for path in input_paths)
+    if audio:
+        streams = "".join(f"[{i}:v][{i}:a]" for i in range(n))
+        cmd += ["-filter_complex", f"{streams}concat=n={n}:v=1:a=1[v][a]",
+                "-map", "[v]", "-map", "[a]",
+                "-c:a", "aac", "-b:a", "192k"]
+    else:
+        streams = "".join(f"[{i}:v]" for i in range(n))
+        cmd += ["-filter_complex", f"{streams}concat=n={n}:v=1:a=0[v]", "-map", "[v]"]
+    cmd += [
         "-c:v", "libx264", "-preset", "fast", "-crf", "20",
-        "-c:a", "aac", "-b:a", "192k",
+        "-movflags", "+faststart",
         str(output_path)
     ]
     result = subprocess.run(cmd, capture_output=True)
@@ -143,32 +227,9 @@ def test_with_scene_trim():
     subprocess.run(cmd_a, capture_output=True)
     print(f"输出: {output_a}")
     
-    print("\n=== 方法 B: 场景分割用重新编码 (修复方式) ===")
-    trimmed1_b = os.path.join(temp_dir, "trimmed1_reencode.mp4")
-    trimmed2_b = os.path.join(temp_dir, "trimmed2_reencode.mp4")
-    
-    print(f"处理 page_001.mp4:")
-    trim_first_scene_reencode(video1, trimmed1_b, THRESHOLD)
-    print(f"处理 page_002.mp4:")
-    trim_first_scene_reencode(video2, trimmed2_b, THRESHOLD)
-    
-    # 拼接
-    list_file_b = os.path.join(temp_dir, "list_b.txt")
-    with open(list_file_b, "w", encoding="utf-8") as f:
-        f.write(f"file '{trimmed1_b}'\n")
-        f.write(f"file '{trimmed2_b}'\n")
-    
+    print("\n=== 方法 B: 场景分割用重新编码 (修复方式，剪辑与拼接合并为一次编码) ===")
     output_b = os.path.join(OUTPUT_DIR, "test_trim_reencode.mp4")
-    cmd_b = [
-        "ffmpeg", "-y",
-        "-f", "concat", "-safe", "0",
-        "-i", list_file_b,
-        "-c:v", "libx264", "-preset", "fast", "-crf", "20",
-        "-c:a", "aac", "-b:a", "192k",
-        "-movflags", "+faststart",
-        output_b
-    ]
-    subprocess.run(cmd_b, capture_output=True)
+    trim_and_concat_reencode([video1, video2], output_b, THRESHOLD)
     print(f"输出: {output_b}")
     
     print("\n=== 完成 ===")
@@ -0,0 +1,128 @@
+"""
+config_manager 测试: 延迟写盘 (dirty/flush) 与重新加载
+"""
+
+import os
+import json
+
+import pytest
+
+import config_manager
+from config_manager import Config
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    # 不启动后台写盘线程，写盘时机完全由测试控制
+    monkeypatch.setattr(Config, "_flush_loop", lambda self, interval=2.0: None)
+    return Config(str(tmp_path / "config.json"))
+
+
+def read_file(cfg):
+    with open(cfg.config_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_missing_file_creates_default(config):
+    assert os.path.exists(config.config_path)
+    assert read_file(config)["video_api"]["model"] == Config.DEFAULT_CONFIG["video_api"]["model"]
+    assert not config._dirty
+
+
+def test_set_sync_writes_immediately(config):
+    config.set("video_api", "model", value="sora-2")
+    assert not config._dirty
+    assert read_file(config)["video_api"]["model"] == "sora-2"
+
+
+def test_set_async_marks_dirty_until_flush(config):
+    config.set("video_api", "model", value="sora-2", sync=False)
+    assert config._dirty
+    assert config.get("video_api", "model") == "sora-2"
+    assert read_file(config)["video_api"]["model"] != "sora-2"
+
+    assert config.flush()
+    assert not config._dirty
+    assert read_file(config)["video_api"]["model"] == "sora-2"
+
+
+def test_set_without_save_leaves_file_untouched(config):
+    config.set("video_api", "model", value="sora-2", save=False)
+    assert not config._dirty
+    assert read_file(config)["video_api"]["model"] != "sora-2"
+
+
+def test_failed_save_keeps_dirty(config, monkeypatch):
+    def fail_replace(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(config_manager.os, "replace", fail_replace)
+
+    config.set("video_api", "model", value="sora-2")
+    assert config._dirty
+    assert not config.flush()
+    assert config._dirty
+
+    monkeypatch.undo()
+    assert config.flush()
+    assert not config._dirty
+    assert read_file(config)["video_api"]["model"] == "sora-2"
+
+
+def test_deferred_save_config_coalesces_until_flush(config):
+    config.config["video_api"]["model"] = "sora-2"
+    config.config["image_api"]["model"] = "img-2"
+    assert config.save_config(sync=False)
+    assert config._dirty
+    assert read_file(config)["video_api"]["model"] != "sora-2"
+
+    assert config.flush()
+    assert not config._dirty
+    data = read_file(config)
+    assert data["video_api"]["model"] == "sora-2"
+    assert data["image_api"]["model"] == "img-2"
+
+
+def test_external_edit_is_picked_up(config):
+    data = read_file(config)
+    data["video_api"]["model"] = "edited"
+    with open(config.config_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)  # 缩进不同，保证文件大小变化
+    assert config.get("video_api", "model") == "edited"
+
+
+def test_pending_changes_win_over_external_edit(config):
+    config.set("video_api", "model", value="sora-2", sync=False)
+    data = read_file(config)
+    data["video_api"]["model"] = "edited"
+    with open(config.config_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+    assert config.get("video_api", "model") == "sora-2"
+
+
+def test_reload_flushes_pending_changes(config):
+    config.set("video_api", "model", value="sora-2", sync=False)
+    config.reload()
+    assert not config._dirty
+    assert config.get("video_api", "model") == "sora-2"
+    assert read_file(config)["video_api"]["model"] == "sora-2"
+
+
+def test_reload_rereads_even_if_signature_unchanged(config):
+    data = read_file(config)
+    data["video_api"]["model"] = "edited"
+    with open(config.config_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+    # 模拟 mtime 精度不足导致签名未变化: 自动检测会跳过，reload 必须强制重新读取
+    config._file_sig = config._stat_sig()
+    assert config.get("video_api", "model") != "edited"
+    config.reload()
+    assert config.get("video_api", "model") == "edited"
+
+
+def test_snapshot_picks_up_external_edit(config):
+    assert config.snapshot()["video_api"]["model"] != "edited"
+    data = read_file(config)
+    data["video_api"]["model"] = "edited"
+    with open(config.config_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+    assert config.snapshot()["video_api"]["model"] == "edited"
@@ -0,0 +1,227 @@
+"""
+video_post_processor 测试:
+- 首个镜头切点的内存/磁盘缓存与 force 重新检测 (场景检测与时长读取均替换为假实现，不需要 ffmpeg 或真实视频)
+- _find_first_scene_cut 与 scenedetect ContentDetector 的一致性 (合成视频)
+"""
+
+import sys
+import json
+import types
+import importlib.util
+
+import pytest
+
+_HAVE_SCENEDETECT = importlib.util.find_spec("scenedetect") is not None
+
+# natsort / scenedetect 缺失时 video_post_processor 会在导入时尝试 pip 安装；
+# 这里只测试缓存逻辑 (检测函数被替换)，缺失时用空模块占位即可
+if importlib.util.find_spec("natsort") is None:
+    sys.modules.setdefault("natsort", types.ModuleType("natsort"))
+if not _HAVE_SCENEDETECT:
+    _scenedetect = types.ModuleType("scenedetect")
+    _scenedetect.open_video = _scenedetect.SceneManager = _scenedetect.ContentDetector = None
+    sys.modules.setdefault("scenedetect", _scenedetect)
+
+import video_post_processor as vpp
+from video_post_processor import VideoPostProcessor
+
+
+class FakeDetector:
+    """替代 _find_first_scene_cut: 返回预设切点并记录调用次数"""
+
+    def __init__(self, cut):
+        self.cut = cut
+        self.calls = 0
+
+    def __call__(self, video_path, threshold, min_scene_len=15):
+        self.calls += 1
+        return self.cut
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "videos" / "page_001.mp4"
+    path.parent.mkdir()
+    path.write_bytes(b"fake video")
+    return path
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    detector = FakeDetector(1.5)
+    monkeypatch.setattr(vpp, "cv2", object())  # 走 OpenCV 快速检测分支
+    monkeypatch.setattr(vpp, "_find_first_scene_cut", detector)
+    monkeypatch.setattr(VideoPostProcessor, "get_duration", lambda self, path: 10.0)
+    monkeypatch.setattr(vpp, "_scene_cache", vpp.OrderedDict())
+    return detector
+
+
+def make_processor(tmp_path):
+    return VideoPostProcessor(str(tmp_path / "videos"), str(tmp_path / "audio"), str(tmp_path / "out"))
+
+
+def test_detected_cut_is_cached_in_memory_and_on_disk(tmp_path, video, detector):
+    processor = make_processor(tmp_path)
+    assert processor.first_scene_end(video) == 1.5
+    assert processor.first_scene_end(video) == 1.5
+    assert detector.calls == 1
+
+    with open(processor._scene_cache_path, "r", encoding="utf-8") as f:
+        assert list(json.load(f).values()) == [1.5]
+
+
+def test_disk_cache_is_reused_by_new_processor(tmp_path, video, detector, monkeypatch):
+    make_processor(tmp_path).first_scene_end(video)
+    monkeypatch.setattr(vpp, "_scene_cache", vpp.OrderedDict())  # 模拟新进程
+
+    assert make_processor(tmp_path).first_scene_end(video) == 1.5
+    assert detector.calls == 1
+
+
+def test_no_cut_is_not_cached(tmp_path, video, detector):
+    detector.cut = None
+    processor = make_processor(tmp_path)
+    assert processor.first_scene_end(video) == 0.0
+    assert not processor._scene_cache_path.exists()
+
+    detector.cut = 2.0
+    assert processor.first_scene_end(video) == 2.0
+    assert detector.calls == 2
+
+
+def test_unknown_duration_is_not_cached(tmp_path, video, detector, monkeypatch):
+    monkeypatch.setattr(VideoPostProcessor, "get_duration", lambda self, path: None)
+    processor = make_processor(tmp_path)
+    assert processor.first_scene_end(video) == 0.0
+    assert not processor._scene_cache_path.exists()
+    assert len(vpp._scene_cache) == 0
+
+
+def test_cut_spanning_whole_video_is_cached_as_zero(tmp_path, video, detector):
+    detector.cut = 12.0
+    processor = make_processor(tmp_path)
+    assert processor.first_scene_end(video) == 0.0
+    assert processor.first_scene_end(video) == 0.0
+    assert detector.calls == 1
+
+
+def test_force_redetects_and_overwrites_cache(tmp_path, video, detector, monkeypatch):
+    processor = make_processor(tmp_path)
+    processor.first_scene_end(video)
+
+    detector.cut = 3.0
+    assert processor.first_scene_end(video) == 1.5
+    assert processor.first_scene_end(video, force=True) == 3.0
+    assert detector.calls == 2
+    assert processor.first_scene_end(video) == 3.0
+
+    monkeypatch.setattr(vpp, "_scene_cache", vpp.OrderedDict())
+    assert make_processor(tmp_path).first_scene_end(video) == 3.0
+    assert detector.calls == 2
+
+
+def test_modified_file_invalidates_cache(tmp_path, video, detector):
+    processor = make_processor(tmp_path)
+    processor.first_scene_end(video)
+
+    video.write_bytes(b"regenerated video")
+    detector.cut = 4.0
+    assert processor.first_scene_end(video) == 4.0
+    assert detector.calls == 2
+
+
+# ==========================================
+# _find_first_scene_cut
+# ==========================================
+
+def moving_stripes_hsv(n, size=64, period=32, speed=1.5):
+    """镜头 1: 彩色竖条纹每帧平移 speed 像素 (相邻帧差值小，间隔数帧后差值远超阈值)"""
+    np = pytest.importorskip("numpy")
+    x = np.arange(size)
+    frames = []
+    for i in range(n):
+        phase = 2 * np.pi * (x + i * speed) / period
+        hsv = np.zeros((size, size, 3), np.uint8)
+        hsv[..., 0] = (90 + 80 * np.sin(phase)).astype(np.uint8)
+        hsv[..., 1] = (150 + 100 * np.sin(phase + 1)).astype(np.uint8)
+        hsv[..., 2] = (150 + 100 * np.cos(phase)).astype(np.uint8)
+        frames.append(hsv)
+    return frames
+
+
+def solid_hsv(n, size=64, color=(120, 200, 200)):
+    """镜头 2: 纯色画面"""
+    np = pytest.importorskip("numpy")
+    frame = np.zeros((size, size, 3), np.uint8)
+    frame[:] = color
+    return [frame] * n
+
+
+class FakeCapture:
+    """按顺序返回预先生成的帧 (帧本身已是 64x64 HSV)"""
+
+    def __init__(self, frames, fps):
+        self.frames = iter(frames)
+        self.fps = fps
+
+    def get(self, prop):
+        return self.fps
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        frame = next(self.frames, None)
+        return frame is not None, frame
+
+    def release(self):
+        pass
+
+
+def fake_cv2(frames, fps):
+    np = pytest.importorskip("numpy")
+    return types.SimpleNamespace(
+        VideoCapture=lambda path: FakeCapture(frames, fps),
+        CAP_PROP_FPS=5, INTER_AREA=3, COLOR_BGR2HSV=40,
+        resize=lambda frame, size, interpolation=None: frame,
+        cvtColor=lambda frame, code: frame,
+        absdiff=lambda a, b: np.abs(a.astype(np.int16) - b.astype(np.int16)),
+    )
+
+
+def test_motion_within_first_shot_is_not_a_cut(monkeypatch):
+    frames = moving_stripes_hsv(60) + solid_hsv(48)
+    monkeypatch.setattr(vpp, "cv2", fake_cv2(frames, 24.0))
+    assert vpp._find_first_scene_cut("clip.mp4", 27.0) == pytest.approx(60 / 24)
+
+
+def test_no_cut_returns_none(monkeypatch):
+    monkeypatch.setattr(vpp, "cv2", fake_cv2(moving_stripes_hsv(60), 24.0))
+    assert vpp._find_first_scene_cut("clip.mp4", 27.0) is None
+
+
+def test_cut_before_min_scene_len_is_ignored(monkeypatch):
+    frames = solid_hsv(5, color=(0, 0, 0)) + solid_hsv(30) + solid_hsv(30, color=(10, 50, 50))
+    monkeypatch.setattr(vpp, "cv2", fake_cv2(frames, 24.0))
+    assert vpp._find_first_scene_cut("clip.mp4", 27.0) == pytest.approx(35 / 24)
+
+
+@pytest.mark.skipif(not _HAVE_SCENEDETECT, reason="需要 scenedetect")
+def test_matches_scenedetect_on_synthetic_video(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    from scenedetect import open_video, SceneManager, ContentDetector
+
+    fps = 24
+    path = str(tmp_path / "synthetic.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (128, 128))
+    for hsv in moving_stripes_hsv(60, size=128) + solid_hsv(48, size=128):
+        writer.write(cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR))
+    writer.release()
+
+    manager = SceneManager()
+    manager.add_detector(ContentDetector(threshold=27.0, min_scene_len=15))
+    manager.detect_scenes(open_video(path), show_progress=False)
+    expected = manager.get_scene_list()[0][1].get_seconds()
+
+    assert vpp.cv2 is cv2
+    assert vpp._find_first_scene_cut(path, 27.0) == pytest.approx(expected, abs=1 / fps)
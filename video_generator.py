@@ -7,17 +7,40 @@
 import os
 import re
 import time
-import base64
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
 from openai import OpenAI
 
+from image_utils import file_data_url, remove_partial
+
+# httpx 随 openai 一起安装；缺失时退回 OpenAI 默认的 HTTP 客户端
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# 响应中的视频地址: <video src='...'> 标签或裸 mp4 链接 (模块级预编译)
+_VIDEO_TAG_RE = re.compile(r"<video src='([^']+)'")
+_MP4_URL_RE = re.compile(r'https://[^\s"]+\.mp4')
+# 跨片段匹配时保留的尾部文本长度 (足以容纳带签名参数的长 URL)
+_TAIL_KEEP = 4096
+_URL_TERMINATORS = " \t\r\n\"'"
+
+# [PERF] 所有 VideoGenerator 实例及更换配置后重建的 OpenAI 客户端共用同一个连接池，
+# keep-alive 连接 (TCP + TLS) 跨客户端复用，不必每次重建后重新握手
+_SHARED_HTTP_CLIENT = httpx.Client(
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=32, keepalive_expiry=60),
+    follow_redirects=True,
+) if httpx is not None else None
+
 
 class VideoGenerator:
     """视频生成器类"""
     
     def __init__(self, api_key: str = "sk-dummy", base_url: str = "http://127.0.0.1:8003/v1", 
-                 model_name: str = "sora"):
+                 model_name: str = "sora", max_concurrent: int = 8):
         """
         初始化视频生成器
         
@@ -25,11 +48,20 @@ class VideoGenerator:
             api_key: API 密钥
             base_url: Sora2 API 基础地址
             model_name: 模型名称
+            max_concurrent: 同时进行的生成任务上限 (超出的调用排队等待)
         """
         self.api_key = api_key
         self.base_url = base_url
         self.model_name = model_name
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        # 前端按 generation.concurrency.video 并发提交各页任务 (服务端每个请求一个线程)；
+        # 多个页面/标签页同时提交时由此限制对 Sora 接口的并发，避免触发限流
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self.client = None  # OpenAI 客户端，首次使用时创建 (见 _get_client)
+        # [PERF] 视频下载复用连接池: 重试与多个视频之间共用 keep-alive 连接，免去重复 TCP/TLS 握手
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
         self._output_dir = os.path.join(os.path.dirname(__file__), "output", "videos")
         
         # 确保输出目录存在
@@ -46,17 +78,28 @@ class VideoGenerator:
         self._output_dir = value
         os.makedirs(value, exist_ok=True)
     
+    def _get_client(self):
+        """获取 OpenAI 客户端 (延迟创建)"""
+        if not self.client:
+            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url,
+                                 http_client=_SHARED_HTTP_CLIENT)
+        return self.client
+    
     def update_config(self, api_key: str, base_url: str, model_name: str):
-        """更新 API 配置"""
+        """更新 API 配置 (仅在连接参数变化时重建客户端)"""
+        if api_key != self.api_key or base_url != self.base_url:
+            self.client = None # Reset client
         self.api_key = api_key
         self.base_url = base_url
         self.model_name = model_name
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+    
+    def close(self):
+        """关闭下载连接池"""
+        self._session.close()
     
     def _encode_image(self, image_path: str) -> str:
-        """将图片编码为 base64"""
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+        """将图片编码为 base64 data URL (结果按文件 mtime/大小 缓存)"""
+        return file_data_url(image_path)
     
     def generate_video(self, prompt: str, reference_image: str, filename: str,
                        force_regenerate: bool = False) -> dict:
@@ -72,8 +115,14 @@ class VideoGenerator:
         Returns:
             dict: {"success": bool, "path": str, "url": str, "error": str, "status": str}
         """
+        with self._slots:
+            return self._do_generate(prompt, reference_image, filename, force_regenerate)
+    
+    def _do_generate(self, prompt: str, reference_image: str, filename: str,
+                     force_regenerate: bool) -> dict:
+        """实际执行生成的内部方法 (调用方已占用并发名额)"""
+        # 输出目录已由 __init__ / output_dir setter 创建，这里不再每次 mkdir
         output_folder = Path(self.output_dir)
-        output_folder.mkdir(parents=True, exist_ok=True)
         
         save_path = output_folder / f"{filename}.mp4"
         
@@ -93,7 +142,7 @@ class VideoGenerator:
             try:
                 # 编码参考图片
                 if reference_image and os.path.exists(reference_image):
-                    image_data_url = f"data:image/png;base64,{self._encode_image(reference_image)}"
+                    image_data_url = self._encode_image(reference_image)
                 else:
                     return {
                         "success": False,
@@ -104,7 +153,7 @@ class VideoGenerator:
                     }
                 
                 # 调用 API（流式响应）
-                response = self.client.chat.completions.create(
+                response = self._get_client().chat.completions.create(
                     model=self.model_name,
                     messages=[
                         {
@@ -118,16 +167,36 @@ class VideoGenerator:
                     stream=True
                 )
                 
-                full_content = ""
+                # 片段先收集到列表，结束后一次 join (避免逐片段拼接字符串)
+                parts = []
+                tail = ""  # 滚动缓冲: 视频地址可能被拆分在相邻的片段中
+                match = None
                 
                 for chunk in response:
                     if chunk.choices and chunk.choices[0].delta.content:
                         content = chunk.choices[0].delta.content
-                        full_content += content
+                        parts.append(content)
+                        # [PERF] 拿到完整的视频地址后立即关闭连接，不再等待服务端的后续文本
+                        tail = tail[-_TAIL_KEEP:] + content
+                        # [PERF] 地址只有在结束符 (引号/空白) 到达时才可能变完整，
+                        # 本片段不含结束符时跳过正则扫描，避免每个片段都扫描整个滚动缓冲
+                        if "'" in content:
+                            match = _VIDEO_TAG_RE.search(tail)
+                        if (not match and "<video" not in tail and ".mp4" in tail
+                                and any(c in content for c in _URL_TERMINATORS)):
+                            # 裸 mp4 链接: 后面已跟有空白/引号才算完整 (避免截断仍在传输的签名参数)
+                            m = _MP4_URL_RE.search(tail)
+                            if m and m.end() < len(tail) and tail[m.end()] in _URL_TERMINATORS:
+                                match = m
+                        if match:
+                            response.response.close()
+                            break
+                
+                full_content = "".join(parts)
                 
                 # 提取视频 URL
-                match = re.search(r"<video src='([^']+)'", full_content) or \
-                        re.search(r'https://[^\s"]+\.mp4', full_content)
+                if not match:
+                    match = _VIDEO_TAG_RE.search(full_content) or _MP4_URL_RE.search(full_content)
                 
                 if not match:
                     if not full_content:
@@ -157,7 +226,8 @@ class VideoGenerator:
                         "status": "failed"
                     }
                 
-                video_url = match.group(1) if match.group(1).startswith('http') else match.group(0)
+                # 标签匹配取 src 内容；裸 mp4 链接的正则没有分组，取整个匹配
+                video_url = match.group(1) if match.re is _VIDEO_TAG_RE else match.group(0)
                 
                 # 下载视频
                 download_success = self._download_video(video_url, str(save_path))
@@ -214,16 +284,31 @@ class VideoGenerator:
         
         for attempt in range(max_download_retries):
             try:
-                r = requests.get(url, stream=True, timeout=120, headers=headers)
-                r.raise_for_status()
-                
-                with open(save_path, "wb") as f:
-                    for chunk in r.iter_content(8192):
-                        f.write(chunk)
+                tmp_path = save_path + ".part"
+                with self._session.get(url, stream=True, timeout=120, headers=headers) as r:
+                    r.raise_for_status()
+                    
+                    with open(tmp_path, "wb") as f:
+                        # 已知大小时预分配磁盘空间 (仅 POSIX)，减少文件增长时的碎片与元数据更新
+                        size = r.headers.get("Content-Length")
+                        if size and size.isdigit() and hasattr(os, "posix_fallocate"):
+                            try:
+                                os.posix_fallocate(f.fileno(), 0, int(size))
+                            except OSError:
+                                pass
+                        # 1 MiB 分块: 每次循环搬运大块数据，减少解释器循环与 write 调用次数
+                        for chunk in r.iter_content(chunk_size=1024 * 1024):
+                            f.write(chunk)
                 
+                # 下载完整后再替换 (中途失败不会留下看似已存在的半截视频)
+                os.replace(tmp_path, save_path)
                 return True
                 
             except Exception as e:
+                remove_partial(tmp_path)  # 失败时不留下残缺的 .part 文件
+                if isinstance(e, FileNotFoundError):
+                    # 输出目录在运行期间被删除时重新创建后重试
+                    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
                 if attempt < max_download_retries - 1:
                     time.sleep(retry_delay)
                     retry_delay = min(retry_delay * 2, 10)
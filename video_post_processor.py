@@ -7,10 +7,16 @@
 """
 
 import os
+import json
+import math
 import subprocess
 import glob
 import shutil
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # 第三方库导入
@@ -26,6 +32,93 @@ except ImportError:
     subprocess.run(["pip", "install", "scenedetect[opencv]"], check=True)
     from scenedetect import open_video, SceneManager, ContentDetector
 
+# scenedetect[opencv] 已依赖 OpenCV，这里用于快速采样检测首个切点；不可用时回退到 scenedetect
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+# ffprobe 结果缓存: {(路径, mtime_ns, size): 解析后的 JSON}，LRU 淘汰；省去重复启动 ffprobe 子进程，文件变化后自动失效
+_PROBE_CACHE_MAX = 1024
+_probe_cache = OrderedDict()
+_probe_lock = threading.Lock()
+
+# 首个镜头结束时间缓存: {(路径, mtime_ns, size, 阈值): 秒}，场景检测需完整解码视频，未变化的文件不重复检测
+_SCENE_CACHE_MAX = 1024
+_scene_cache = OrderedDict()
+_scene_lock = threading.Lock()
+
+# 片段合并使用的 H.264 编码参数: 优先硬件编码器 (按顺序探测)，都不可用时使用 libx264
+_X264_ARGS = ("-c:v", "libx264", "-preset", "fast", "-crf", "23", "-pix_fmt", "yuv420p")
+_HW_ENCODER_ARGS = (
+    ("h264_nvenc", ("-c:v", "h264_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", "23", "-b:v", "0", "-pix_fmt", "yuv420p")),
+    ("h264_qsv", ("-c:v", "h264_qsv", "-global_quality", "23", "-pix_fmt", "nv12")),
+    ("h264_videotoolbox", ("-c:v", "h264_videotoolbox", "-b:v", "8M", "-pix_fmt", "yuv420p")),
+    ("h264_amf", ("-c:v", "h264_amf", "-rc", "cqp", "-qp_i", "23", "-qp_p", "23", "-pix_fmt", "yuv420p")),
+)
+# [PERF] 所有片段统一 profile/level/GOP/时间基与音频参数，同一编码器输出的片段拼接时可直接流复制
+_PARITY_VIDEO_ARGS = (
+    "-profile:v", "high", "-level", "4.1",
+    "-g", "48", "-keyint_min", "48", "-sc_threshold", "0",
+)
+_MP4_TIMESCALE_ARGS = ("-video_track_timescale", "15360")
+_PARITY_AUDIO_ARGS = ("-c:a", "aac", "-b:a", "192k", "-ar", "48000", "-ac", "2")
+
+
+def _find_first_scene_cut(video_path: str, threshold: float, min_scene_len: int = 15) -> float:
+    """
+    [PERF] 只找第一个切点: 每帧缩小到 64x64 转 HSV，与前一帧比较平均绝对差，超过阈值立即返回，无需解码到片尾
+    与 scenedetect ContentDetector 一样比较相邻帧，threshold 含义不变 (间隔多帧比较时，正常的镜头/角色运动
+    也会累积出很大的差值，导致过早误判切点)
+    Returns: 切点时间(秒)，未检测到返回 None
+    """
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if not cap.isOpened() or not fps:
+            raise IOError(f"无法打开视频: {video_path}")
+        prev = None
+        frame_num = 0
+        while True:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            small = cv2.cvtColor(cv2.resize(frame, (64, 64), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2HSV)
+            # 切点位于前一帧与当前帧之间，从当前帧开始可确保不残留第一个镜头的画面
+            if prev is not None and frame_num >= min_scene_len and cv2.absdiff(small, prev).mean() > threshold:
+                return frame_num / fps
+            prev = small
+            frame_num += 1
+        return None
+    finally:
+        cap.release()
+
+
+@lru_cache(maxsize=1)
+def _detect_video_encoder() -> tuple:
+    """
+    [PERF] 探测可用的硬件 H.264 编码器 (每个进程只探测一次)
+    ffmpeg -encoders 只说明编译时支持，还需用一小段测试画面实际编码确认硬件/驱动可用
+    """
+    try:
+        listed = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"],
+                                capture_output=True).stdout.decode("utf-8", "ignore")
+    except OSError:
+        return _X264_ARGS
+    for name, args in _HW_ENCODER_ARGS:
+        if name not in listed:
+            continue
+        test = subprocess.run([
+            "ffmpeg", "-hide_banner", "-v", "error",
+            "-f", "lavfi", "-i", "color=c=black:s=256x256:d=0.2",
+            *args, *_PARITY_VIDEO_ARGS, "-f", "null", "-"
+        ], capture_output=True)
+        if test.returncode == 0:
+            print(f"🚀 使用硬件编码器: {name}")
+            return args
+    return _X264_ARGS
+
 
 class VideoPostProcessor:
     """视频后处理器：删除第一个镜头 + 配音对齐 + 合并"""
@@ -38,7 +131,9 @@ class VideoPostProcessor:
         final_output_path: str = None,
         threshold: float = 27.0,
         video_volume: float = 0.05,
-        audio_volume: float = 4.0
+        audio_volume: float = 4.0,
+        max_workers: int = None,
+        stream_copy_concat: bool = False
     ):
         """
         初始化视频后处理器
@@ -51,6 +146,9 @@ class VideoPostProcessor:
             threshold: 场景检测阈值 (值越大，检测越宽松)
             video_volume: 原视频音量倍率 (0-5, 1为原始音量)
             audio_volume: 配音音量倍率 (0-5, 1为原始音量)
+            max_workers: 并行处理的文件数 (默认 CPU 核数的一半，每个 ffmpeg 使用 2 线程)
+            stream_copy_concat: [实验] 所有片段由同一编码器编码时，拼接直接流复制而不重新编码
+                (可能在片段切换处卡顿或出现 AAC 起始静音间隙，默认关闭)
         """
         self.video_folder = Path(video_folder)
         self.audio_folder = Path(audio_folder)
@@ -59,53 +157,109 @@ class VideoPostProcessor:
         self.threshold = threshold
         self.video_volume = video_volume
         self.audio_volume = audio_volume
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.stream_copy_concat = stream_copy_concat
+        # 合并片段路径 -> 视频编码器名 ("copy" 表示视频流直接复制)，用于判断拼接能否流复制
+        self._segment_encoders = {}
+        # [NEW] 首个镜头结束时间的磁盘缓存 (跨进程复用): {"文件名:大小:mtime_ns:阈值": 秒}
+        self._scene_cache_path = self.output_folder / ".scenecache.json"
+        self._scene_disk_lock = threading.Lock()
+        self._scene_disk_cache = None  # 首次使用时加载
         
         # 临时文件夹
         self.trimmed_folder = self.output_folder / "trimmed"
         self.merged_folder = self.output_folder / "merged"
         
-        # 创建目录
+        # 创建目录 (trimmed 仅在单独执行 trim_all_videos 时使用，按需创建)
         self.output_folder.mkdir(parents=True, exist_ok=True)
-        self.trimmed_folder.mkdir(parents=True, exist_ok=True)
         self.merged_folder.mkdir(parents=True, exist_ok=True)
         
         # 有效文件扩展名
         self.valid_video_ext = ['.mp4', '.mov', '.avi', '.mkv', '.webm']
         self.valid_audio_ext = ['.wav', '.mp3', '.m4a', '.aac']
+        self._valid_video_ext_set = frozenset(self.valid_video_ext)
+        self._valid_audio_ext_set = frozenset(self.valid_audio_ext)
     
     # ==========================================
     # 工具函数
     # ==========================================
     
-    def get_duration(self, file_path: str) -> float:
-        """获取媒体文件时长(秒)"""
+    def _probe(self, file_path: str) -> dict:
+        """
+        [PERF] 一次 ffprobe 同时读取格式与全部流信息 (时长 + 是否有音频)，结果按 路径+mtime+大小 缓存
+        失败时返回 None (不缓存)
+        """
+        file_path = str(file_path)
+        try:
+            st = os.stat(file_path)
+        except OSError as e:
+            print(f"⚠️ 无法读取媒体信息: {file_path}, 错误: {e}")
+            return None
+        key = (file_path, st.st_mtime_ns, st.st_size)
+        with _probe_lock:
+            data = _probe_cache.get(key)
+            if data is not None:
+                _probe_cache.move_to_end(key)
+                return data
+        
         cmd = [
             "ffprobe", "-v", "error",
-            "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1",
-            str(file_path)
+            "-show_entries", "format=duration:stream=codec_type",
+            "-of", "json",
+            file_path
         ]
         try:
-            output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode('utf-8').strip()
-            return float(output)
+            data = json.loads(subprocess.check_output(cmd, stderr=subprocess.DEVNULL))
         except Exception as e:
+            print(f"⚠️ 无法读取媒体信息: {file_path}, 错误: {e}")
+            return None
+        
+        with _probe_lock:
+            _probe_cache[key] = data
+            if len(_probe_cache) > _PROBE_CACHE_MAX:
+                _probe_cache.popitem(last=False)
+        return data
+    
+    def get_duration(self, file_path: str) -> float:
+        """获取媒体文件时长(秒)"""
+        data = self._probe(file_path)
+        if data is None:
+            return None
+        try:
+            return float(data["format"]["duration"])
+        except (KeyError, TypeError, ValueError) as e:
             print(f"⚠️ 无法获取文件时长: {file_path}, 错误: {e}")
             return None
     
     def has_audio_stream(self, file_path: str) -> bool:
         """检查视频文件是否包含音频流"""
-        cmd = [
-            "ffprobe", "-v", "error",
-            "-select_streams", "a",
-            "-show_entries", "stream=codec_type",
-            "-of", "csv=p=0",
-            str(file_path)
-        ]
-        try:
-            output = subprocess.check_output(cmd, stderr=subprocess.DEVNULL).decode('utf-8').strip()
-            return len(output) > 0
-        except:
+        data = self._probe(file_path)
+        if data is None:
             return False
+        return any(stream.get("codec_type") == "audio" for stream in data.get("streams", ()))
+    
+    def _list_media(self, folder: Path, valid_ext: frozenset) -> list:
+        """[PERF] 一次 os.scandir 遍历目录，按扩展名 (不区分大小写) 筛选后自然排序；目录不存在时返回空列表"""
+        try:
+            with os.scandir(folder) as it:
+                entries = [
+                    Path(entry.path) for entry in it
+                    if entry.is_file() and os.path.splitext(entry.name)[1].lower() in valid_ext
+                ]
+        except FileNotFoundError:
+            return []
+        return natsort.natsorted(entries)
+    
+    def _ffmpeg_threads(self) -> list:
+        """并行处理多个文件时限制每个 ffmpeg 的编码线程数，避免进程间争抢 CPU"""
+        return ["-threads", "2"] if self.max_workers > 1 else []
+    
+    def _map(self, func, *iterables) -> list:
+        """[PERF] 各文件互相独立 (主要耗时在 ffmpeg 子进程中)，用线程池并行执行，结果保持原顺序"""
+        if self.max_workers <= 1:
+            return list(map(func, *iterables))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(func, *iterables))
     
     def get_atempo_filter(self, speed: float) -> str:
         """
@@ -115,17 +269,20 @@ class VideoPostProcessor:
         if abs(speed - 1.0) < 0.001:
             return "atempo=1.0"
         
+        # [PERF] 直接算出需要级联的 2.0/0.5 个数，余数用 ldexp 一次缩放 (按 2 的幂缩放无精度损失)
         filters = []
         
-        # 处理加速情况 (speed > 1)
-        while speed > 2.0:
-            filters.append("atempo=2.0")
-            speed /= 2.0
+        # 处理加速情况 (speed > 2): n 个 atempo=2.0，余数落在 (1, 2]
+        if speed > 2.0:
+            n = math.ceil(math.log2(speed)) - 1
+            filters = ["atempo=2.0"] * n
+            speed = math.ldexp(speed, -n)
         
-        # 处理减速情况 (speed < 1)
-        while speed < 0.5:
-            filters.append("atempo=0.5")
-            speed /= 0.5
+        # 处理减速情况 (speed < 0.5): n 个 atempo=0.5，余数落在 [0.5, 1)
+        elif speed < 0.5:
+            n = math.ceil(-math.log2(speed)) - 1
+            filters = ["atempo=0.5"] * n
+            speed = math.ldexp(speed, n)
         
         filters.append(f"atempo={speed:.6f}")
         return ",".join(filters)
@@ -144,6 +301,96 @@ class VideoPostProcessor:
             print(f"⚠️ 场景检测失败 {os.path.basename(video_path)}: {e}")
             return []
     
+    def _load_scene_disk_cache(self) -> dict:
+        """读取场景检测磁盘缓存 (只读一次)，文件不存在或损坏时返回空字典；调用方需持有 _scene_disk_lock"""
+        if self._scene_disk_cache is None:
+            try:
+                with open(self._scene_cache_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self._scene_disk_cache = data if isinstance(data, dict) else {}
+            except (OSError, ValueError):
+                self._scene_disk_cache = {}
+        return self._scene_disk_cache
+    
+    def _save_scene_disk_cache(self, disk_key: str, cut: float):
+        """写入一条检测结果并原子替换缓存文件 (先写临时文件再 os.replace，避免中断留下损坏的 JSON)"""
+        with self._scene_disk_lock:
+            cache = self._load_scene_disk_cache()
+            cache[disk_key] = cut
+            tmp_path = self._scene_cache_path.with_name(self._scene_cache_path.name + ".tmp")
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(cache, f, ensure_ascii=False)
+                os.replace(tmp_path, self._scene_cache_path)
+            except OSError as e:
+                print(f"⚠️ 无法保存场景检测缓存: {e}")
+    
+    def first_scene_end(self, video_path: Path, force: bool = False) -> float:
+        """
+        获取第一个镜头的结束时间(秒)，未检测到场景或首个镜头贯穿全片时返回 0
+        检测到的结果按 路径+mtime+大小+阈值 缓存在内存，并按 文件名+大小+mtime+阈值
+        持久化到输出目录的 .scenecache.json；未检测到切点或检测/读取时长失败时不缓存，下次重新检测
+        force=True 时跳过两级缓存重新检测，并覆盖缓存中的旧结果
+        """
+        video_path = str(video_path)
+        try:
+            st = os.stat(video_path)
+        except OSError:
+            return 0.0
+        key = (video_path, st.st_mtime_ns, st.st_size, self.threshold)
+        disk_key = f"{os.path.basename(video_path)}:{st.st_size}:{st.st_mtime_ns}:{self.threshold}"
+        if not force:
+            with _scene_lock:
+                cut = _scene_cache.get(key)
+                if cut is not None:
+                    _scene_cache.move_to_end(key)
+                    return cut
+            
+            with self._scene_disk_lock:
+                cut = self._load_scene_disk_cache().get(disk_key)
+            if isinstance(cut, (int, float)):
+                with _scene_lock:
+                    _scene_cache[key] = float(cut)
+                return float(cut)
+        
+        print(f"✂️ 正在检测场景: {os.path.basename(video_path)}")
+        first_scene_end_time = None
+        detected = False
+        if cv2 is not None:
+            try:
+                first_scene_end_time = _find_first_scene_cut(video_path, self.threshold)
+                detected = True
+            except Exception as e:
+                print(f"   ⚠️ OpenCV 场景检测失败，改用 scenedetect: {e}")
+        if not detected:
+            scenes = self.find_scenes(video_path)
+            if scenes:
+                first_scene_end_time = scenes[0][1].get_seconds()
+        
+        if first_scene_end_time is None:
+            print(f"   ⚠️ 未检测到场景，保留原视频")
+            return 0.0
+        
+        video_duration = self.get_duration(video_path)
+        if not video_duration:
+            print(f"   ⚠️ 无法读取视频时长，保留原视频")
+            return 0.0
+        
+        print(f"   ⏱️ 首个镜头结束于: {first_scene_end_time:.2f}s / 总时长: {video_duration:.2f}s")
+        cut = first_scene_end_time
+        if first_scene_end_time >= video_duration:
+            print(f"   ⚠️ 第一个镜头贯穿全片，保留原视频")
+            cut = 0.0
+        
+        # 只缓存确实检测到切点的结果
+        with _scene_lock:
+            _scene_cache[key] = cut
+            _scene_cache.move_to_end(key)
+            if len(_scene_cache) > _SCENE_CACHE_MAX:
+                _scene_cache.popitem(last=False)
+        self._save_scene_disk_cache(disk_key, cut)
+        return cut
+    
     # ==========================================
     # 步骤1: 删除第一个镜头
     # ==========================================
@@ -164,26 +411,13 @@ class VideoPostProcessor:
             print(f"⏩ 已存在剪辑版，跳过: {input_path.name}")
             return True
         
-        print(f"✂️ 正在检测场景: {input_path.name}")
-        scenes = self.find_scenes(str(input_path))
+        first_scene_end_time = self.first_scene_end(input_path, force)
         
-        if not scenes:
-            print(f"   ⚠️ 未检测到场景，复制原视频")
+        if not first_scene_end_time:
             shutil.copy2(input_path, output_path)
             return True
         
         try:
-            # 获取第一个场景结束时间
-            first_scene_end_time = scenes[0][1].get_seconds()
-            video_duration = self.get_duration(str(input_path))
-            
-            print(f"   ⏱️ 首个镜头结束于: {first_scene_end_time:.2f}s / 总时长: {video_duration:.2f}s")
-            
-            if first_scene_end_time >= video_duration:
-                print(f"   ⚠️ 第一个镜头贯穿全片，复制原视频")
-                shutil.copy2(input_path, output_path)
-                return True
-            
             # 使用重新编码剪辑，确保关键帧对齐，避免拼接时卡顿
             # -ss 放在 -i 前面可以更快地定位
             cmd = [
@@ -192,6 +426,7 @@ class VideoPostProcessor:
                 "-i", str(input_path),
                 "-c:v", "libx264", "-preset", "fast", "-crf", "20",
                 "-c:a", "aac", "-b:a", "192k",
+                *self._ffmpeg_threads(),
                 str(output_path)
             ]
             
@@ -219,11 +454,8 @@ class VideoPostProcessor:
         print("步骤 1: 删除每个视频的第一个镜头")
         print("="*50)
         
-        video_files = []
-        for ext in self.valid_video_ext:
-            video_files.extend(self.video_folder.glob(f"*{ext}"))
-        
-        video_files = natsort.natsorted(video_files)
+        self.trimmed_folder.mkdir(parents=True, exist_ok=True)
+        video_files = self._list_media(self.video_folder, self._valid_video_ext_set)
         
         if not video_files:
             print(f"⚠️ 未找到视频文件: {self.video_folder}")
@@ -231,19 +463,16 @@ class VideoPostProcessor:
         
         print(f"📁 找到 {len(video_files)} 个视频文件")
         
-        trimmed_videos = []
-        for video_path in video_files:
-            output_path = self.trimmed_folder / video_path.name
-            if self.trim_first_scene(video_path, output_path, force):
-                trimmed_videos.append(output_path)
+        output_paths = [self.trimmed_folder / video_path.name for video_path in video_files]
+        results = self._map(lambda src, dst: self.trim_first_scene(src, dst, force), video_files, output_paths)
         
-        return trimmed_videos
+        return [output_path for output_path, ok in zip(output_paths, results) if ok]
     
     # ==========================================
     # 步骤2: 以配音时长为准合并
     # ==========================================
     
-    def merge_with_audio(self, video_path: Path, audio_path: Path, output_path: Path) -> bool:
+    def merge_with_audio(self, video_path: Path, audio_path: Path, output_path: Path, start: float = 0.0) -> bool:
         """
         将视频与配音合并，以配音时长为准调整视频速度
         
@@ -251,6 +480,7 @@ class VideoPostProcessor:
             video_path: 视频路径
             audio_path: 配音路径
             output_path: 输出路径
+            start: [NEW] 视频起始时间(秒)，用于在同一次编码中删除第一个镜头
             
         Returns:
             是否成功
@@ -258,8 +488,10 @@ class VideoPostProcessor:
         # 获取时长
         dur_audio = self.get_duration(str(audio_path))
         dur_video = self.get_duration(str(video_path))
+        if dur_video and start > 0:
+            dur_video -= start
         
-        if not dur_audio or not dur_video:
+        if not dur_audio or not dur_video or dur_video <= 0:
             print(f"   ⚠️ 无法读取时长，跳过")
             return False
         
@@ -275,44 +507,66 @@ class VideoPostProcessor:
         # 构建 FFmpeg 命令
         has_orig_audio = self.has_audio_stream(str(video_path))
         
-        # 视频滤镜: 调整PTS以改变时长
-        video_filter = f"[0:v]setpts=PTS*{pts_factor}[v_out]"
+        # [PERF] 视频比配音略长 (不足 2%) 时不变速: 视频流直接复制，只处理音频，省去整段 H.264 重新编码
+        # (配音更长时仍需拉伸视频，否则 -shortest 会截掉配音结尾；需要剪掉开头时流复制只能从关键帧切，不能复制)
+        copy_video = start <= 0 and 0.98 < pts_factor <= 1.0
         
-        # 音频滤镜
-        atempo_chain = self.get_atempo_filter(audio_speed_factor)
+        if copy_video:
+            filters = []
+            orig_audio_chain = f"volume={self.video_volume}"  # 视频未变速，原声保持原速
+            video_map = "0:v"
+            video_codec = ["-c:v", "copy"]
+        else:
+            # 视频滤镜: 调整PTS以改变时长
+            filters = [f"[0:v]setpts=PTS*{pts_factor}[v_out]"]
+            # 音频滤镜
+            orig_audio_chain = f"{self.get_atempo_filter(audio_speed_factor)},volume={self.video_volume}"
+            video_map = "[v_out]"
+            video_codec = list(_detect_video_encoder())
         
         if has_orig_audio:
             # 复杂滤镜：处理原声 + 外部音频混合
-            filter_complex = (
-                f"{video_filter};"
-                f"[0:a]{atempo_chain},volume={self.video_volume}[a_orig];"
-                f"[1:a]volume={self.audio_volume}[a_ext];"
-                f"[a_orig][a_ext]amix=inputs=2:duration=longest[a_out]"
-            )
-            map_cmd = ["-map", "[v_out]", "-map", "[a_out]"]
+            filters += [
+                f"[0:a]{orig_audio_chain}[a_orig]",
+                f"[1:a]volume={self.audio_volume}[a_ext]",
+                f"[a_orig][a_ext]amix=inputs=2:duration=longest[a_out]",
+            ]
         else:
             # 视频没声音，直接使用外部音频
-            filter_complex = (
-                f"{video_filter};"
-                f"[1:a]volume={self.audio_volume}[a_out]"
-            )
-            map_cmd = ["-map", "[v_out]", "-map", "[a_out]"]
+            filters.append(f"[1:a]volume={self.audio_volume}[a_out]")
+        filter_complex = ";".join(filters)
+        map_cmd = ["-map", video_map, "-map", "[a_out]"]
+        
+        # -ss 放在 -i 前面为输入定位 (快速且重新编码时帧精确)
+        seek_cmd = ["-ss", f"{start:.3f}"] if start > 0 else []
         
         cmd = [
             "ffmpeg", "-y",
+            *seek_cmd,
             "-i", str(video_path),
             "-i", str(audio_path),
             "-filter_complex", filter_complex,
             *map_cmd,
-            "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-            "-c:a", "aac", "-b:a", "192k",
+            *video_codec,
+            *(() if copy_video else _PARITY_VIDEO_ARGS),
+            *_MP4_TIMESCALE_ARGS,
+            *_PARITY_AUDIO_ARGS,
             "-shortest",
+            *self._ffmpeg_threads(),
             str(output_path)
         ]
         
         result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
         
+        if result.returncode != 0 and not copy_video and video_codec != list(_X264_ARGS):
+            # 硬件编码失败 (如并行任务超出 NVENC 会话数上限) 时改用 libx264 重试
+            print(f"   ⚠️ 硬件编码失败，改用 libx264 重试")
+            i = cmd.index(video_codec[0])
+            cmd[i:i + len(video_codec)] = _X264_ARGS
+            result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        
         if result.returncode == 0:
+            self._segment_encoders[str(output_path)] = "copy" if copy_video else cmd[cmd.index("-c:v") + 1]
             return True
         else:
             print(f"   ❌ 合并失败: {result.stderr.decode('utf-8')[:200]}")
@@ -330,24 +584,19 @@ class VideoPostProcessor:
         print("="*50)
         
         # 获取所有音频文件
-        audio_files = []
-        for ext in self.valid_audio_ext:
-            audio_files.extend(self.audio_folder.glob(f"*{ext}"))
-        
-        audio_files = natsort.natsorted(audio_files)
+        audio_files = self._list_media(self.audio_folder, self._valid_audio_ext_set)
         
         if not audio_files:
             print(f"⚠️ 未找到音频文件: {self.audio_folder}")
             return []
         
         # 创建视频文件名到路径的映射 (使用剪辑后的视频)
-        video_files = list(self.trimmed_folder.glob("*"))
-        video_map = {f.stem: f for f in video_files if f.suffix.lower() in self.valid_video_ext}
+        video_files = self._list_media(self.trimmed_folder, self._valid_video_ext_set)
+        video_map = {f.stem: f for f in video_files}
         
         print(f"📁 找到 {len(audio_files)} 个音频文件，{len(video_map)} 个剪辑后视频")
         
-        merged_segments = []
-        
+        jobs = []
         for i, audio_path in enumerate(audio_files):
             base_name = audio_path.stem
             
@@ -355,18 +604,72 @@ class VideoPostProcessor:
                 print(f"⚠️ 跳过: 找不到对应视频 -> {base_name}")
                 continue
             
-            video_path = video_map[base_name]
-            output_path = self.merged_folder / f"{i:03d}_{base_name}.mp4"
-            
-            print(f"🎬 处理: {base_name}")
-            
+            jobs.append((video_map[base_name], audio_path, self.merged_folder / f"{i:03d}_{base_name}.mp4"))
+        
+        def merge_one(job):
+            video_path, audio_path, output_path = job
+            print(f"🎬 处理: {audio_path.stem}")
             if self.merge_with_audio(video_path, audio_path, output_path):
-                merged_segments.append(output_path)
-                print(f"   ✅ 合并完成")
-            else:
-                print(f"   ❌ 合并失败")
+                print(f"   ✅ 合并完成: {audio_path.stem}")
+                return True
+            print(f"   ❌ 合并失败: {audio_path.stem}")
+            return False
         
-        return merged_segments
+        results = self._map(merge_one, jobs)
+        # 结果按 jobs (音频自然顺序) 返回，拼接顺序不受并行完成先后影响
+        return [job[2] for job, ok in zip(jobs, results) if ok]
+
+    def trim_and_merge_all(self, force: bool = False) -> list:
+        """
+        [PERF] 单次 ffmpeg 完成步骤 1 + 2: 以 -ss 输入定位跳过第一个镜头，同一滤镜图中变速、混音并只编码一次，
+        不再先写出剪辑后的中间文件；各视频由线程池并行处理
+
+        Args:
+            force: 是否忽略缓存重新检测场景 (片段总是重新合并)
+
+        Returns:
+            合并后的视频片段路径列表 (按配音自然顺序)
+        """
+        print("\n" + "="*50)
+        print("步骤 1+2: 删除第一个镜头并以配音时长为准合并 (单次编码)")
+        print("="*50)
+
+        video_files = self._list_media(self.video_folder, self._valid_video_ext_set)
+
+        if not video_files:
+            print(f"⚠️ 未找到视频文件: {self.video_folder}")
+            return []
+
+        audio_files = self._list_media(self.audio_folder, self._valid_audio_ext_set)
+
+        if not audio_files:
+            print(f"⚠️ 未找到音频文件: {self.audio_folder}")
+            return []
+
+        print(f"📁 找到 {len(video_files)} 个视频文件，{len(audio_files)} 个音频文件")
+
+        video_map = {video_path.stem: video_path for video_path in video_files}
+        jobs = []
+        for i, audio_path in enumerate(audio_files):
+            base_name = audio_path.stem
+            if base_name not in video_map:
+                print(f"⚠️ 跳过: 找不到对应视频 -> {base_name}")
+                continue
+            jobs.append((video_map[base_name], audio_path, self.merged_folder / f"{i:03d}_{base_name}.mp4"))
+
+        def trim_and_merge(job):
+            video_path, audio_path, output_path = job
+            start = self.first_scene_end(video_path, force)
+            print(f"🎬 处理: {audio_path.stem}")
+            if self.merge_with_audio(video_path, audio_path, output_path, start=start):
+                print(f"   ✅ 合并完成: {audio_path.stem}")
+                return True
+            print(f"   ❌ 合并失败: {audio_path.stem}")
+            return False
+
+        results = self._map(trim_and_merge, jobs)
+        # 结果按 jobs (音频自然顺序) 返回，拼接顺序不受并行完成先后影响
+        return [job[2] for job, ok in zip(jobs, results) if ok]
     
     # ==========================================
     # 步骤3: 拼接所有片段
@@ -395,22 +698,39 @@ class VideoPostProcessor:
         # 创建文件列表
         list_file_path = self.output_folder / "file_list.txt"
         
+        # [PERF] 使用相对于列表文件的路径 (concat demuxer 按列表文件所在目录解析)，省去逐个求绝对路径；
+        # 一次性写入，单引号按 concat 语法转义
+        base = str(list_file_path.parent)
+        lines = []
+        for segment in segments:
+            rel_path = Path(os.path.relpath(segment, base)).as_posix().replace("'", "'\\''")
+            lines.append(f"file '{rel_path}'\n")
         with open(list_file_path, "w", encoding="utf-8") as f:
-            for segment in segments:
-                # concat demuxer 使用绝对路径
-                f.write(f"file '{segment.absolute()}'\n")
+            f.write("".join(lines))
         
         # 先输出到临时路径 (避免中文路径问题)
         tmp_output_path = self.output_folder / "final_merged.mp4"
         
-        # 使用重新编码而非流复制，确保关键帧对齐，避免片段切换时卡顿
+        # 默认使用重新编码而非流复制，确保关键帧对齐，避免片段切换时卡顿；
+        # 仅在显式开启 stream_copy_concat 且所有片段由同一编码器按统一参数编码时直接流复制
+        stream_copy = False
+        if self.stream_copy_concat:
+            encoders = {self._segment_encoders.get(str(segment)) for segment in segments}
+            stream_copy = len(encoders) == 1 and not encoders & {None, "copy"}
+        if stream_copy:
+            codec_cmd = ["-c", "copy"]
+        else:
+            codec_cmd = [
+                "-c:v", "libx264", "-preset", "fast", "-crf", "20",
+                "-c:a", "aac", "-b:a", "192k",
+            ]
+        
         concat_cmd = [
             "ffmpeg", "-y",
             "-f", "concat",
             "-safe", "0",
             "-i", str(list_file_path),
-            "-c:v", "libx264", "-preset", "fast", "-crf", "20",
-            "-c:a", "aac", "-b:a", "192k",
+            *codec_cmd,
             "-movflags", "+faststart",  # 优化网页播放
             str(tmp_output_path)
         ]
@@ -424,7 +744,11 @@ class VideoPostProcessor:
         # 如果指定了最终路径，复制过去
         if self.final_output_path:
             self.final_output_path.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(tmp_output_path, self.final_output_path)
+            # [PERF] 同一文件系统内直接重命名 (O(1))；跨文件系统时用 copyfile (Linux 上走内核零拷贝，且不复制元数据)
+            try:
+                os.replace(tmp_output_path, self.final_output_path)
+            except OSError:
+                shutil.copyfile(tmp_output_path, self.final_output_path)
             print(f"✅ 最终视频已生成: {self.final_output_path}")
             return self.final_output_path
         else:
@@ -454,14 +778,8 @@ class VideoPostProcessor:
         print(f"📂 输出文件夹: {self.output_folder}")
         print(f"🎚️ 原视频音量: {self.video_volume} | 配音音量: {self.audio_volume}")
         
-        # 步骤1: 删除第一个镜头
-        trimmed_videos = self.trim_all_videos(force=force_trim)
-        if not trimmed_videos:
-            print("⚠️ 没有成功剪辑的视频")
-            return None
-        
-        # 步骤2: 以配音时长为准合并
-        merged_segments = self.merge_all_with_audio()
+        # 步骤1 + 2: 删除第一个镜头，并以配音时长为准合并 (单次编码)
+        merged_segments = self.trim_and_merge_all(force=force_trim)
         if not merged_segments:
             print("⚠️ 没有成功合并的视频片段")
             return None
@@ -501,7 +819,10 @@ if __name__ == "__main__":
     parser.add_argument("--threshold", "-t", type=float, default=27.0, help="场景检测阈值 (默认: 27.0)")
     parser.add_argument("--video-volume", type=float, default=0.05, help="原视频音量 (默认: 0.05)")
     parser.add_argument("--audio-volume", type=float, default=4.0, help="配音音量 (默认: 4.0)")
+    parser.add_argument("--workers", type=int, default=None, help="并行处理的文件数 (默认: CPU 核数的一半)")
     parser.add_argument("--force", action="store_true", help="强制重新剪辑")
+    parser.add_argument("--stream-copy-concat", action="store_true",
+                        help="[实验] 片段编码参数一致时拼接直接流复制 (可能在片段切换处卡顿)")
     parser.add_argument("--no-cleanup", action="store_true", help="不清理临时文件")
     
     args = parser.parse_args()
@@ -513,7 +834,9 @@ if __name__ == "__main__":
         final_output_path=args.final,
         threshold=args.threshold,
         video_volume=args.video_volume,
-        audio_volume=args.audio_volume
+        audio_volume=args.audio_volume,
+        max_workers=args.workers,
+        stream_copy_concat=args.stream_copy_concat
     )
     
     processor.process(force_trim=args.force, cleanup=not args.no_cleanup)